@@ -12,7 +12,16 @@ from telethon.tl.functions.messages import RequestWebViewRequest
 from telethon.tl.types import DataJSON
 from telethon.tl.types import InputUser
 from urllib.parse import urlparse
-from bot_handle import handle_webapp
+from bot_handle import handle_webapp, BROWSER_POOL
+from device_emulation import TelegramDeviceConfig
+
+# Event loop на libuv (asyncio.run вызывается из Rust после импорта модуля)
+# uvloop недоступен на Windows, там остается стандартный цикл
+try:
+    import uvloop
+    uvloop.install()
+except ImportError:
+    pass
 
 # Загрузка переменных окружения
 load_dotenv()
@@ -21,7 +30,7 @@ load_dotenv()
 ENABLE_LOGGING = os.getenv('ENABLE_LOGGING', 'true').lower() == 'true'
 
 class TelegramMiniAppAutomation:
-    def __init__(self, client: TelegramClient, app_url: str, device_config: dict, bot_metadata: dict = None, webapp_data: dict = None):
+    def __init__(self, client: TelegramClient, app_url: str, device_config: TelegramDeviceConfig, bot_metadata: dict = None, webapp_data: dict = None):
         self.client = client
         self.app_url = app_url
         self.device_config = device_config
@@ -340,6 +349,7 @@ async def initialize_automation() -> bool:
             if login:
                 logger.debug("Очистка ресурсов логина")
                 await login.cleanup()
+            await BROWSER_POOL.close()
         except Exception as e:
             logger.error(f"Ошибка при закрытии ресурсов: {e}")
 
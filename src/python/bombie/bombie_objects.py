@@ -2,41 +2,125 @@
 import numpy as np
 import easyocr
 import random 
-import io 
-from PIL import Image
+import base64
+import cv2
 import asyncio
+import time
 from loguru import logger
 from typing import Dict, Tuple, Optional
 from .cordination_module import GameObjects, ViewportConfig
 from .data_class import BoxCoordinates, BoxObject, GlobalBoxStorage, box_storage
-from .ocr_manager import OCRManager
+from .ocr_manager import OCRManager, clear_text_cache
 
 class ScreenManager:
+    # Время жизни кэшированного кадра в секундах
+    SCREENSHOT_CACHE_TTL = 0.15
+    # Качество JPEG кадра: декодирование заметно дешевле PNG
+    SCREENSHOT_JPEG_QUALITY = 80
+
     def __init__(self, page, game_objects=None):
         self.page = page
         self.reader = OCRManager().get_reader
         self.game_objects = game_objects if game_objects else GameObjects()
         self.viewport = self.game_objects.viewport
+        # Последний полный кадр: (время получения, изображение)
+        self._last_shot: Optional[Tuple[float, np.ndarray]] = None
+        self._cdp = None
+        # Два постоянных буфера кадра viewport, заполняются по очереди: кадр, возвращенный
+        # вызывающему коду, остается валидным до следующего за ним скриншота включительно
+        # (этого достаточно для сравнения соседних кадров в _wait_until_stable)
+        shape = (int(self.viewport.height), int(self.viewport.width), 3)
+        self._shot_bufs = (np.empty(shape, dtype=np.uint8), np.empty(shape, dtype=np.uint8))
+        self._shot_buf_idx = 0
+
+    def invalidate_cache(self):
+        """Сброс кэшированного кадра и кэша OCR (вызывается после каждого клика)"""
+        self._last_shot = None
+        clear_text_cache()
 
-    async def take_screenshot(self, area: Optional[BoxCoordinates] = None) -> Optional[np.ndarray]:
+    async def _capture_jpeg(self) -> bytes:
+        """
+        JPEG кадр viewport через Page.captureScreenshot постоянной CDP сессии.
+        Если CDP недоступен, используется page.screenshot
+        """
         try:
+            if self._cdp is None:
+                self._cdp = await self.page.context.new_cdp_session(self.page)
+            result = await self._cdp.send("Page.captureScreenshot", {
+                "format": "jpeg",
+                "quality": self.SCREENSHOT_JPEG_QUALITY,
+                "clip": {
+                    "x": 0, "y": 0,
+                    "width": self.viewport.width,
+                    "height": self.viewport.height,
+                    "scale": 1
+                }
+            })
+            return base64.b64decode(result["data"])
+        except Exception as e:
+            logger.warning(f"Скриншот через CDP не удался, используем page.screenshot: {e}")
+            self._cdp = None
+            return await self.page.screenshot(
+                type='jpeg',
+                quality=self.SCREENSHOT_JPEG_QUALITY,
+                full_page=False,
+                scale='css'
+            )
+
+    async def take_screenshot(self, area: Optional[BoxCoordinates] = None,
+                              use_cache: bool = False) -> Optional[np.ndarray]:
+        """
+        Скриншот viewport или его области.
+        Область возвращается отдельной копией. Весь кадр (area=None) - это постоянный буфер,
+        который перезаписывается через один скриншот: его нельзя передавать в другие потоки
+        или хранить между скриншотами без copy()
+
+        Args:
+            area: Область для обрезки. Если None, возвращается весь кадр
+            use_cache: Разрешить переиспользовать кадр, полученный не более
+                SCREENSHOT_CACHE_TTL секунд назад
+        """
+        try:
+            if use_cache and self._last_shot is not None:
+                shot_time, cached = self._last_shot
+                if time.monotonic() - shot_time < self.SCREENSHOT_CACHE_TTL:
+                    logger.debug("Используется кэшированный скриншот")
+                    return self._crop(cached, area)
+
             viewport_height = self.viewport.height
             viewport_width = self.viewport.width
             
             logger.debug(f"Ожидаемые размеры viewport: {viewport_width}x{viewport_height}")
             
-            # Получаем скриншот как bytes
-            screenshot_bytes = await self.page.screenshot(
-                type='png',
-                full_page=False,
-                scale='css' 
-            )
-            
-            # Конвертируем bytes в numpy array через PIL
-            # (сохраняем текущий пайплайн обработки изображения)
-            image = Image.open(io.BytesIO(screenshot_bytes))
-            screenshot_array = np.array(image)
+            # Получаем JPEG кадр и декодируем его один раз через OpenCV
+            screenshot_bytes = await self._capture_jpeg()
+            screenshot_array = cv2.imdecode(np.frombuffer(screenshot_bytes, np.uint8), cv2.IMREAD_COLOR)
+            if screenshot_array is None:
+                logger.error("Не удалось декодировать скриншот")
+                return None
+
+            # При deviceScaleFactor > 1 кадр приходит в физических пикселях
+            if screenshot_array.shape[:2] != (viewport_height, viewport_width):
+                screenshot_array = cv2.resize(screenshot_array, (viewport_width, viewport_height),
+                                              interpolation=cv2.INTER_AREA)
+
+            # Остальной пайплайн (шаблоны, OCR) рассчитан на RGB, как раньше отдавал PIL.
+            # Конвертация пишет прямо в постоянный буфер вместо новой аллокации
+            self._shot_buf_idx ^= 1
+            screenshot_array = cv2.cvtColor(screenshot_array, cv2.COLOR_BGR2RGB,
+                                            dst=self._shot_bufs[self._shot_buf_idx])
+            self._last_shot = (time.monotonic(), screenshot_array)
+
+            return self._crop(screenshot_array, area)
             
+        except Exception as e:
+            logger.error(f"Ошибка создания скриншота: {e}")
+            return None
+
+    @staticmethod
+    def _crop(screenshot_array: np.ndarray, area: Optional[BoxCoordinates]) -> np.ndarray:
+        """Обрезка кадра по области (копия: области уходят в OCR в пуле потоков, а кадр в буфере перезаписывается)"""
+        try:
             # Если указана область, обрезаем изображение
             if area:
                 x1 = max(0, min(area.top_left_x, area.bottom_left_x))
@@ -45,13 +129,13 @@ class ScreenManager:
                 y2 = max(0, min(area.bottom_left_y, area.bottom_right_y))
                 
                 logger.debug(f"Обрезка области: x1={x1}, y1={y1}, x2={x2}, y2={y2}")
-                screenshot_array = screenshot_array[int(y1):int(y2), int(x1):int(x2)]
+                screenshot_array = screenshot_array[int(y1):int(y2), int(x1):int(x2)].copy()
             
             logger.debug(f"Итоговый размер скриншота: {screenshot_array.shape}")
             return screenshot_array
             
         except Exception as e:
-            logger.error(f"Ошибка создания скриншота: {e}")
+            logger.error(f"Ошибка обрезки скриншота: {e}")
             return None
 
     async def get_text_from_area(self, image: np.ndarray, area: BoxCoordinates) -> str:
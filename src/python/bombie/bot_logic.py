@@ -6,8 +6,10 @@ from loguru import logger
 from playwright.async_api import Page
 from utils import HumanBehavior
 from .chest_action import ChestActions
-from .task_action import TaskActions
+from .task_action import TaskActions, TaskResult
 from .module_manager import ModuleController, ModuleState
+from .ocr_manager import OCRManager
+from .cv_manager import CVManager
 from datetime import datetime, timedelta
 
 class WebAppLogic:
@@ -17,6 +19,24 @@ class WebAppLogic:
         self.is_running = True
         self.module_controller = ModuleController()
 
+    @staticmethod
+    def _load_models():
+        """Загрузка моделей OCR и шаблонов CV (синглтоны)"""
+        try:
+            OCRManager()
+            CVManager()
+            logger.debug("Модели OCR и шаблоны CV загружены")
+        except Exception as e:
+            logger.error(f"Ошибка предварительной загрузки OCR и шаблонов: {e}")
+
+    @staticmethod
+    async def prewarm():
+        """
+        Подготовка логики, не требующая страницы: модели и шаблоны грузятся
+        в отдельном потоке, пока браузер запускается и выполняет навигацию
+        """
+        await asyncio.to_thread(WebAppLogic._load_models)
+
     # ВАЖНАЯ ЛОГИКА! 
     # МОДУЛЬЯ КОНТРОЛЯ!
     # УПРАВЛЯЕТ ЛОГИЧЕСКИМИ МОДУЛЯМИ!
@@ -206,11 +226,11 @@ class WebAppLogic:
                 result = await task_actions.process_daily_tasks()
                 
                 match result:
-                    case 'continue':
+                    case TaskResult.CONTINUE:
                         logger.info("Награды успешно собраны, продолжаем")
                         await asyncio.sleep(1)
                         continue
-                    case 'done':
+                    case TaskResult.DONE:
                         # Устанавливаем время ожидания и переводим в PAUSED
                         wait_time = 1800 + 5  # 1800 секунд + 5 секунд
                         self.module_controller.registry.update_state(
@@ -227,7 +247,7 @@ class WebAppLogic:
                         )
                         logger.info(f"Переход в режим ожидания на {wait_time} секунд")
                         break
-                    case 'error':
+                    case TaskResult.ERROR:
                         logger.error("Ошибка при обработке ежедневных заданий")
                         continue
                     case _:
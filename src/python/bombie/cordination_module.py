@@ -2,7 +2,6 @@
 import json
 import glob
 import os
-import random
 import numpy as np
 from pathlib import Path
 from dataclasses import dataclass, field
@@ -13,6 +12,12 @@ from .data_class import BoxCoordinates, BoxObject, GlobalBoxStorage, box_storage
 from .ocr_manager import OCRManager
 import math
 
+# Пул заранее сгенерированных случайных точек для каждой области клика:
+# координаты области -> [массив точек (N, 2), индекс следующей точки]
+POINT_POOL_SIZE = 1024
+_point_pool: Dict[Tuple[float, ...], list] = {}
+_rng = np.random.default_rng()
+
 @dataclass
 class ViewportConfig:
     """Конфигурация viewport с динамическими размерами"""
@@ -50,15 +55,19 @@ class ViewportLoader:
                 return {}
                 
             latest_dir = max(trace_dirs, key=os.path.getctime)
-            json_file = Path(latest_dir) / "interactions.json"
+            json_file = Path(latest_dir) / "interactions.jsonl"
             
             if not json_file.exists():
-                logger.debug("Используются стандартные размеры viewport: height=815, width=412 (файл interactions.json не найден)")
+                logger.debug("Используются стандартные размеры viewport: height=815, width=412 (файл interactions.jsonl не найден)")
                 return {}
                 
-            with open(json_file, 'r') as f:
-                data = json.load(f)
-                for event in reversed(data):
+            with open(json_file, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+                # Файл построчный (NDJSON): разбираем с конца только строки с webAppState
+                for line in reversed(lines):
+                    if '"webAppState"' not in line:
+                        continue
+                    event = json.loads(line)
                     if "webAppState" in event:
                         height = event["webAppState"].get("viewportHeight", 815)
                         width = event["webAppState"].get("viewportStableWidth", 412)
@@ -160,6 +169,20 @@ class GameObjects:
                 logger.error(f"Некорректный тип координат: {type(coordinates)}")
                 return (0.5, 0.5)
 
+            # Берем следующую точку из пула области, если он еще не исчерпан
+            pool_key = (
+                coordinates.top_left_x, coordinates.top_left_y,
+                coordinates.top_right_x, coordinates.top_right_y,
+                coordinates.bottom_right_x, coordinates.bottom_right_y,
+                coordinates.bottom_left_x, coordinates.bottom_left_y
+            )
+            pool = _point_pool.get(pool_key)
+            if pool is not None and pool[1] < POINT_POOL_SIZE:
+                random_x, random_y = pool[0][pool[1]]
+                pool[1] += 1
+                logger.debug(f"Сгенерированная точка: ({random_x}, {random_y})")
+                return (float(random_x), float(random_y))
+
             # Получаем все точки
             points = [
                 (coordinates.top_left_x, coordinates.top_left_y),
@@ -198,12 +221,13 @@ class GameObjects:
             x_min, x_max = find_range_bounds(x_values)
             y_min, y_max = find_range_bounds(y_values)
 
-            # Генерируем случайную точку внутри определенных границ
-            random_x = random.uniform(x_min, x_max)
-            random_y = random.uniform(y_min, y_max)
+            # Генерируем пакет случайных точек внутри определенных границ
+            points_batch = _rng.uniform((x_min, y_min), (x_max, y_max), size=(POINT_POOL_SIZE, 2))
+            _point_pool[pool_key] = [points_batch, 1]
+            random_x, random_y = points_batch[0]
 
             logger.debug(f"Сгенерированная точка: ({random_x}, {random_y})")
-            return (random_x, random_y)
+            return (float(random_x), float(random_y))
 
         except Exception as e:
             logger.error(f"Ошибка при получении случайной точки: {e}")
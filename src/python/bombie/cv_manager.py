@@ -361,4 +361,32 @@ class CVManager:
             
         except Exception as e:
             logger.error(f"Ошибка при проверке некорректного выбора предмета: {e}")
-            return False
\ No newline at end of file
+            return False
+
+    # Быстрая оценка наличия кнопки 'Получ.' в списке ежедневных заданий
+    def match_daily_task_reward_button(self, image: np.ndarray) -> float:
+        """
+        Оценка совпадения области с шаблоном кнопки получения награды
+
+        Args:
+            image: RGB-кадр области кнопки (как возвращает ScreenManager)
+
+        Returns:
+            float: Максимальное значение TM_CCOEFF_NORMED, 0.0 при ошибке
+        """
+        try:
+            # Шаблон загружен через cv2.imread в BGR, приводим кадр к тому же порядку каналов
+            bgr = cv2.cvtColor(image[..., :3], cv2.COLOR_RGB2BGR)
+            template = self.scale_template_if_needed(
+                bgr,
+                self.true_task_button_dayli_task_template,
+                self.true_task_button_dayli_task_template
+            )[0]
+
+            score = float(cv2.matchTemplate(bgr, template, cv2.TM_CCOEFF_NORMED).max())
+            logger.debug(f"Совпадение кнопки получения награды: {score:.3f}")
+            return score
+
+        except Exception as e:
+            logger.error(f"Ошибка при сравнении с шаблоном кнопки наград: {e}")
+            return 0.0
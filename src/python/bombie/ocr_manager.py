@@ -1,3 +1,5 @@
+import os
+import re
 import torch
 import cv2
 from loguru import logger
@@ -9,10 +11,142 @@ import numpy as np
 import certifi
 import ssl
 import urllib.request
+from pathlib import Path
+from collections import OrderedDict
+
+try:
+    import onnxruntime as ort
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+except ImportError:
+    ort = None
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+# Директория для хранения моделей EasyOCR и экспортированных ONNX графов
+MODELS_DIR = Path('./models')
+
+# Кэш результатов check_text_in_area по перцептивному хэшу области.
+# Включается вызывающим кодом (use_cache=True) только для опроса HUD и сбрасывается после каждого клика:
+# dHash кнопки часто не меняется при смене ее надписи
+TEXT_CACHE_SIZE = 256
+_text_cache: OrderedDict = OrderedDict()
+# Ключи кэша для скомпилированных матчеров, вычисляются один раз на матчер (матчер хранится вместе с ключом)
+_matcher_keys: dict = {}
+
+
+def clear_text_cache():
+    """Сброс кэша результатов check_text_in_area"""
+    _text_cache.clear()
+
+
+def _matcher_key(matcher) -> tuple:
+    """Ключ кэша для матчера из compile_texts: искомые тексты, без обхода автомата на каждом вызове"""
+    entry = _matcher_keys.get(id(matcher))
+    if entry is None:
+        if isinstance(matcher, re.Pattern):
+            key = (matcher.pattern, matcher.flags)
+        else:
+            key = tuple(matcher.keys())
+        entry = _matcher_keys[id(matcher)] = (matcher, key)
+    return entry[1]
+
+
+def to_gray(image: np.ndarray) -> np.ndarray:
+    """Перевод в оттенки серого, одноканальное изображение возвращается как есть"""
+    if image.ndim == 2:
+        return image
+    return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+
+def _dhash(image: np.ndarray) -> int:
+    """64-битный dHash изображения: знаки горизонтальных градиентов на сетке 9x8"""
+    gray = to_gray(image)
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+class _RecognizerExport(torch.nn.Module):
+    """Обертка распознавателя EasyOCR для экспорта в ONNX (аргумент text не используется)"""
+    def __init__(self, model: torch.nn.Module):
+        super().__init__()
+        self.model = model
+
+    def forward(self, image: torch.Tensor) -> torch.Tensor:
+        return self.model(image, None)
+
+
+class ONNXRecognizer:
+    """
+    Замена reader.recognizer, выполняющая CRNN через ONNX Runtime
+    с INT8 квантизацией и полной оптимизацией графа
+    """
+    def __init__(self, model_path: Path):
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(
+            str(model_path),
+            sess_options=options,
+            providers=['CPUExecutionProvider']
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, image: torch.Tensor, text=None) -> torch.Tensor:
+        preds = self.session.run(None, {self.input_name: image.cpu().numpy()})[0]
+        return torch.from_numpy(preds)
+
+    def eval(self):
+        # Совместимость с интерфейсом torch.nn.Module
+        return self
+
+
+class PinnedTransfer(torch.nn.Module):
+    """
+    Обертка модели для GPU: входные тензоры копируются в page-locked память
+    и передаются на устройство асинхронно (non_blocking), перекрывая копирование с вычислениями.
+    Pinned буфер выделяется один раз на форму входа и переиспользуется через copy_
+    """
+    MAX_PINNED = 8
+
+    def __init__(self, model: torch.nn.Module, device: str):
+        super().__init__()
+        self.model = model
+        self.device = device
+        # (позиция, форма, dtype) -> (pinned буфер, событие завершения последней передачи)
+        self._pinned: OrderedDict = OrderedDict()
+
+    def _to_device(self, index: int, value):
+        if not (isinstance(value, torch.Tensor) and value.device.type == 'cpu'):
+            return value
+        key = (index, tuple(value.shape), value.dtype)
+        entry = self._pinned.get(key)
+        if entry is None:
+            entry = (torch.empty(value.shape, dtype=value.dtype, pin_memory=True),
+                     torch.cuda.Event())
+            self._pinned[key] = entry
+            if len(self._pinned) > self.MAX_PINNED:
+                self._pinned.popitem(last=False)
+        else:
+            self._pinned.move_to_end(key)
+        buffer, done = entry
+        # Буфер нельзя перезаписывать, пока предыдущая асинхронная передача не завершилась
+        done.synchronize()
+        buffer.copy_(value)
+        result = buffer.to(self.device, non_blocking=True)
+        done.record()
+        return result
+
+    def forward(self, *args):
+        return self.model(*(self._to_device(i, arg) for i, arg in enumerate(args)))
+
 
 class OCRManager:
     _instance = None
     _reader = None
+    _used_gpu = False
     
     def __new__(cls):
         if cls._instance is None:
@@ -21,6 +155,24 @@ class OCRManager:
                 # Настройки для безопасной загрузки моделей
                 torch.backends.cudnn.enabled = False
                 torch.set_grad_enabled(False)
+
+                # OCR вызывается на небольших областях, где накладные расходы
+                # OpenMP fork/join превышают выигрыш от параллелизма
+                torch.set_num_threads(int(os.getenv('OCR_NUM_THREADS', '1')))
+
+                # Использование GPU (требуется CUDA)
+                cls._used_gpu = (os.getenv('ENABLE_OCR_GPU', 'false').lower() == 'true'
+                                 and torch.cuda.is_available())
+
+                # Распознаватель через ONNX Runtime (только CPU, требуется onnxruntime)
+                use_onnx = (os.getenv('ENABLE_OCR_ONNX', 'false').lower() == 'true'
+                            and not cls._used_gpu)
+                if use_onnx and ort is None:
+                    logger.warning("ENABLE_OCR_ONNX включен, но onnxruntime не установлен")
+                    use_onnx = False
+
+                # Компиляция моделей через torch.compile (долгий прогрев при старте)
+                use_compile = os.getenv('ENABLE_OCR_COMPILE', 'false').lower() == 'true'
                 
                 # Настройка безопасного SSL-контекста
                 ssl_context = ssl.create_default_context(
@@ -37,20 +189,99 @@ class OCRManager:
                 # Инициализация reader с безопасными настройками
                 cls._reader = easyocr.Reader(
                     ['ru', 'en'],  # Поддерживаемые языки
-                    model_storage_directory='./models',  # Директория для хранения моделей
+                    model_storage_directory=str(MODELS_DIR),  # Директория для хранения моделей
                     download_enabled=True,  # Разрешить загрузку моделей
                     detector=True,  # Использовать детектор текста
                     recognizer=True,  # Использовать распознаватель текста
                     verbose=False,  # Отключить подробный вывод
-                    gpu=False,  # Не использовать GPU
-                    quantize=True,  # Использовать квантизацию для оптимизации памяти
+                    gpu=cls._used_gpu,  # GPU только при ENABLE_OCR_GPU
+                    quantize=not use_onnx,  # Квантизация torch (для ONNX квантизация выполняется в ORT)
                 )
+
+                if use_onnx:
+                    cls._setup_onnx_recognizer()
+
+                if cls._used_gpu:
+                    cls._setup_pinned_transfer()
+
+                if use_compile:
+                    cls._compile_models()
+
                 logger.info("OCR Manager успешно инициализирован")
             except Exception as e:
                 logger.error(f"Ошибка инициализации OCR: {e}")
                 raise RuntimeError("Не удалось инициализировать OCR") from e
         return cls._instance
 
+    @classmethod
+    def _setup_onnx_recognizer(cls):
+        """Экспорт распознавателя в ONNX, INT8 квантизация и подмена reader.recognizer"""
+        try:
+            onnx_path = MODELS_DIR / 'crnn.onnx'
+            int8_path = MODELS_DIR / 'crnn_int8.onnx'
+
+            if not int8_path.exists():
+                logger.info("Экспорт распознавателя OCR в ONNX")
+                MODELS_DIR.mkdir(parents=True, exist_ok=True)
+                # Вход распознавателя: (batch, 1, 64, width) в оттенках серого
+                dummy_input = torch.zeros((1, 1, 64, 256), dtype=torch.float32)
+                torch.onnx.export(
+                    _RecognizerExport(cls._reader.recognizer).eval(),
+                    dummy_input,
+                    str(onnx_path),
+                    input_names=['input'],
+                    output_names=['output'],
+                    dynamic_axes={'input': {0: 'batch', 3: 'width'},
+                                  'output': {0: 'batch', 1: 'sequence'}},
+                    opset_version=14,
+                )
+                quantize_dynamic(str(onnx_path), str(int8_path), weight_type=QuantType.QInt8)
+                onnx_path.unlink(missing_ok=True)
+
+            cls._reader.recognizer = ONNXRecognizer(int8_path)
+            logger.info("Распознаватель OCR переключен на ONNX Runtime (INT8)")
+        except Exception as e:
+            # Остаемся на PyTorch распознавателе с квантизацией torch
+            logger.warning(f"Не удалось переключить распознаватель на ONNX Runtime: {e}")
+            cls._reader.recognizer = torch.quantization.quantize_dynamic(
+                cls._reader.recognizer, dtype=torch.qint8, inplace=True
+            )
+
+    @classmethod
+    def _setup_pinned_transfer(cls):
+        """
+        Перенос входов детектора и распознавателя на GPU через pinned память.
+        EasyOCR сам выполняет синхронный x.to(device), поэтому reader.device
+        переключается на 'cpu', а копирование выполняют обертки PinnedTransfer.
+        Результаты читаются через .cpu(), что синхронизирует поток CUDA
+        """
+        device = cls._reader.device
+        cls._reader.detector = PinnedTransfer(cls._reader.detector, device)
+        cls._reader.recognizer = PinnedTransfer(cls._reader.recognizer, device)
+        cls._reader.device = 'cpu'
+        logger.info(f"Передача входов OCR на {device} через pinned память")
+
+    @classmethod
+    def _compile_models(cls):
+        """Компиляция детектора и распознавателя с прогревом на пустом кадре"""
+        # Исходные модули возвращаются на место, если компиляция или прогрев упадут
+        detector, recognizer = cls._reader.detector, cls._reader.recognizer
+        try:
+            logger.info("Компиляция моделей OCR через torch.compile")
+            cls._reader.detector = torch.compile(cls._reader.detector, mode="reduce-overhead")
+            # Распознаватель ONNX Runtime не компилируется
+            if isinstance(cls._reader.recognizer, torch.nn.Module):
+                cls._reader.recognizer = torch.compile(cls._reader.recognizer, mode="reduce-overhead")
+
+            # Прогрев: стоимость компиляции переносится на инициализацию
+            dummy = np.zeros((64, 256, 3), dtype=np.uint8)
+            cls._reader.readtext(dummy)
+            cls._reader.recognize(cv2.cvtColor(dummy, cv2.COLOR_BGR2GRAY))
+            logger.info("Модели OCR скомпилированы")
+        except Exception as e:
+            cls._reader.detector, cls._reader.recognizer = detector, recognizer
+            logger.warning(f"Не удалось скомпилировать модели OCR, используются исходные: {e}")
+
     @property
     def get_reader(self):
         if not self._reader:
@@ -61,15 +292,18 @@ class OCRManager:
 
     def __del__(self):
         # Очистка ресурсов при удалении
-        if self._reader:
+        # Reader хранится на уровне класса и освобождается вместе с процессом,
+        # кэш CUDA имеет смысл чистить только если GPU действительно использовался
+        if self._reader is not None and self._used_gpu:
             try:
-                logger.debug("Очистка ресурсов OCR Reader")
-                del self._reader
-                torch.cuda.empty_cache()
-                logger.debug("Ресурсы OCR Reader успешно очищены")
+                if torch.cuda.is_available():
+                    logger.debug("Очистка кэша CUDA OCR Reader")
+                    torch.cuda.empty_cache()
+            except (ImportError, AttributeError):
+                # Модули уже выгружены при завершении интерпретатора
+                pass
             except Exception as e:
                 logger.error(f"Ошибка при очистке ресурсов OCR Reader: {e}")
-                pass
 
 @dataclass
 class OCRCoordinator:
@@ -91,7 +325,7 @@ class OCRCoordinator:
                             interpolation=cv2.INTER_CUBIC)
             
             # Преобразование в оттенки серого
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            gray = to_gray(image)
             
             # Адаптивная бинаризация
             binary = cv2.adaptiveThreshold(gray, 255, 
@@ -107,18 +341,25 @@ class OCRCoordinator:
             return image
     
     @staticmethod
-    def get_numbers_from_image(image: np.ndarray) -> list[str]:
+    def get_numbers_from_image(image: np.ndarray, high_accuracy: bool = False) -> list[str]:
         """
         Оптимизированное получение текста с акцентом на цифры
+
+        Args:
+            image: Изображение в формате numpy array
+            high_accuracy: Использовать beam search вместо жадного CTC декодера
+                (для словаря из 11 символов прироста точности практически нет)
         """
         try:
             reader = OCRManager().get_reader
+
+            # Жадный декодер по умолчанию, beam search только по запросу
+            decoder_params = {'decoder': 'beamsearch', 'beamWidth': 10} if high_accuracy else {'decoder': 'greedy'}
             
             # Параметры для readtext метода
             results = reader.readtext(
                 image,
-                decoder='beamsearch',  # Использовать beam search для лучшего распознавания
-                beamWidth=10,  # Увеличенная ширина луча для более точного поиска
+                **decoder_params,
                 batch_size=1,  # Размер пакета для обработки
                 allowlist='0123456789.',  # Разрешить только цифры и точку
                 detail=1,  # Возвращать детальную информацию
@@ -135,7 +376,7 @@ class OCRCoordinator:
                 add_margin=0.15,  # Дополнительные отступы вокруг текста
             )
             
-            logger.info(f"Найденные тексты: {results}")
+            logger.opt(lazy=True).debug("Найденные тексты: {r}", r=lambda: results)
             
             # Фильтрация и очистка результатов
             detected_texts = []
@@ -165,19 +406,41 @@ class OCRCoordinator:
             logger.error(f"Ошибка распознавания текста: {e}")
             return ["1"]  # Также возвращаем 1 в случае ошибки
 
+    @staticmethod
+    def compile_texts(texts: str | list[str] | tuple[str, ...]):
+        """
+        Объединение искомых текстов в один матчер для check_text_in_area:
+        автомат Ахо-Корасик при установленном pyahocorasick, иначе регистронезависимый regex
+        """
+        texts = (texts,) if isinstance(texts, str) else texts
+        if ahocorasick is not None:
+            automaton = ahocorasick.Automaton()
+            for text in texts:
+                text = text.lower()
+                automaton.add_word(text, text)
+            automaton.make_automaton()
+            return automaton
+        return re.compile('|'.join(map(re.escape, texts)), re.IGNORECASE)
+
     @staticmethod
     def check_text_in_area(image: np.ndarray, 
-                          texts: str | list[str], 
+                          texts: str | list[str] | tuple[str, ...] | re.Pattern, 
                           zone: Optional[BoxCoordinates] = None, 
-                          threshold: float = 0.85) -> Tuple[bool, float]:
+                          threshold: float = 0.85,
+                          use_cache: bool = False,
+                          detect: bool = True) -> Tuple[bool, float]:
         """
         Проверяет наличие текстов в указанной зоне или во всем изображении
         
         Args:
             image: Изображение в формате numpy array
-            texts: Искомый текст или список текстов
+            texts: Искомый текст, список текстов или матчер из compile_texts
             zone: Опциональная зона поиска. Если None, используется все изображение
             threshold: Минимальный порог вероятности распознавания
+            use_cache: Возвращать кэшированный результат, если область визуально не изменилась.
+                Только для опроса HUD: после клика надпись может смениться без изменения dHash
+            detect: Запускать детектор текста. False - область уже обрезана по одной строке
+                (кнопке), и распознаватель запускается сразу по всей области
         """
         logger.debug(f"Поиск текстов{' в зоне: ' + str(zone) if zone else ' во всем изображении'}")
         
@@ -222,30 +485,72 @@ class OCRCoordinator:
 
             # Дальнейшая обработка текста
             reader = OCRManager().get_reader
-            texts_to_check = [texts] if isinstance(texts, str) else texts
+            automaton = None
+            if isinstance(texts, re.Pattern):
+                pattern = texts
+                texts_to_check = _matcher_key(texts)
+            elif ahocorasick is not None and isinstance(texts, ahocorasick.Automaton):
+                pattern = None
+                automaton = texts
+                texts_to_check = _matcher_key(texts)
+            else:
+                pattern = None
+                texts_to_check = (texts,) if isinstance(texts, str) else tuple(texts)
+                search_texts = tuple(text.lower() for text in texts_to_check)
+
+            # Область не изменилась с прошлой проверки - OCR не нужен
+            cache_key = None
+            if use_cache:
+                cache_key = (_dhash(image_to_process), image_to_process.shape[:2],
+                             texts_to_check, threshold, detect)
+                cached = _text_cache.get(cache_key)
+                if cached is not None:
+                    _text_cache.move_to_end(cache_key)
+                    logger.debug(f"Результат поиска текстов {texts_to_check} взят из кэша")
+                    return cached
             
-            results = reader.readtext(image_to_process)
-            logger.debug(f"Найденные тексты: {results}")
+            if detect:
+                results = reader.readtext(image_to_process)
+            else:
+                # Только распознаватель (CRNN/LSTM), вся область - один текстовый блок
+                results = reader.recognize(to_gray(image_to_process))
+            logger.opt(lazy=True).debug("Найденные тексты: {r}", r=lambda: results)
             
             found_matches = []
             total_prob = 0
             
             for _, detected_text, prob in results:
-                for search_text in texts_to_check:
-                    if search_text.lower() in detected_text.lower() and prob >= threshold:
-                        found_matches.append({
-                            'text': search_text,
-                            'prob': prob
-                        })
-                        total_prob += prob
-                        logger.info(f"Найден текст '{search_text}' с вероятностью {prob:.2f}")
+                if prob < threshold:
+                    continue
+
+                if pattern is not None:
+                    matched = [match.group(0) for match in pattern.finditer(detected_text)]
+                elif automaton is not None:
+                    matched = [text for _, text in automaton.iter(detected_text.lower())]
+                else:
+                    detected_lower = detected_text.lower()
+                    matched = [text for text in search_texts if text in detected_lower]
+
+                for search_text in matched:
+                    found_matches.append({
+                        'text': search_text,
+                        'prob': prob
+                    })
+                    total_prob += prob
+                    logger.info(f"Найден текст '{search_text}' с вероятностью {prob:.2f}")
             
             if found_matches:
-                avg_prob = total_prob / len(found_matches)
-                return True, avg_prob
-                
-            logger.debug(f"Тексты {texts_to_check} не найдены")
-            return False, 0.0
+                result = (True, total_prob / len(found_matches))
+            else:
+                logger.debug(f"Тексты {texts_to_check} не найдены")
+                result = (False, 0.0)
+
+            if cache_key is not None:
+                _text_cache[cache_key] = result
+                if len(_text_cache) > TEXT_CACHE_SIZE:
+                    _text_cache.popitem(last=False)
+
+            return result
             
         except cv2.error as cv_err:
             logger.warning(f"OpenCV ошибка: {cv_err}")
@@ -1,25 +1,37 @@
 # tast_action.py
-import re
-import sys
 import asyncio
 import random
-import traceback
-from dataclasses import dataclass
-from pathlib import Path
-from threading import Lock
-
-sys.path.append(str(Path(__file__).parent.parent.parent))
+import cv2
+import numpy as np
+from enum import IntEnum
 
 from loguru import logger
 from utils import HumanBehavior
 from typing import Tuple, Optional
 from .cv_manager import CVManager
-from .ocr_manager import OCRCoordinator
+from .ocr_manager import OCRCoordinator, to_gray
 from .bombie_objects import ScreenManager
 from .chest_action import ChestActions
-from .cordination_module import ViewportConfig, box_storage, BoxCoordinates, GameObjects
+from .cordination_module import BoxCoordinates, GameObjects
+
+# Повторный клик в ту же точку, что и предыдущий шаг
+REPEAT_CLICK = object()
+
+
+class TaskResult(IntEnum):
+    """Результат обработки ежедневных заданий"""
+    CONTINUE = 0
+    DONE = 1
+    ERROR = 2
+
 
 class TaskActions:
+    # Пороги TM_CCOEFF_NORMED для шаблона кнопки 'Получ.': между ними решает OCR
+    REWARD_TEMPLATE_HIT = 0.9
+    REWARD_TEMPLATE_MISS = 0.5
+    # Сколько раз process_daily_tasks пробует дойти до меню заданий (вместо рекурсивного перезапуска)
+    MAX_DAILY_TASK_ATTEMPTS = 3
+
     def __init__(self, page):
         self.page = page
         self.objects = GameObjects()
@@ -27,6 +39,8 @@ class TaskActions:
         self.screen = ScreenManager(page, self.objects)
         self.cv_manager = CVManager()
         self.coordinator = OCRCoordinator()
+        # CDP сессия для кликов (создается при первом клике)
+        self._cdp = None
         # Проверяем инициализацию всех компонентов
         if not all([self.screen, self.objects, self.cv_manager, self.coordinator]):
             logger.error("Ошибка инициализации компонентов")
@@ -38,13 +52,162 @@ class TaskActions:
                 'en': ['start', 'get', 'received']
             }
         }
-        logger.debug(f"Загружены шаблоны текста: {self.text_patterns}")\
+        logger.debug(f"Загружены шаблоны текста: {self.text_patterns}")
+
+        # Тексты для OCR проверок (нижний регистр и шаблоны готовятся один раз)
+        self._continue_texts = tuple(map(str.lower, [
+            'нажмите', 'область', 'закрыть',
+            'click', 'area', 'close'
+        ]))
+        # 'task' покрывает подстрокой 'Daily task', 'Dally task' и 'Permanent Task';
+        # порядок - от самых частых совпадений на экране заданий
+        self._task_menu_texts = ('task', 'получен', 'начать', 'start', 'get')
+        self._rewards_texts = tuple(map(str.lower, ['получ', 'получить', 'get']))
+        self._continue_pattern = OCRCoordinator.compile_texts(self._continue_texts)
+        self._task_menu_pattern = OCRCoordinator.compile_texts(self._task_menu_texts)
+        self._rewards_pattern = OCRCoordinator.compile_texts(self._rewards_texts)
+
+        # Выравнивание контраста для OCR (создается один раз)
+        self._clahe = cv2.createCLAHE(clipLimit=2.0)
+
+        # Области кнопок статичны для viewport, поэтому сценарий сбора бесплатных наград
+        # собирается один раз: группы шагов (цель, область ожидания, базовая пауза),
+        # перед каждой группой проверяется главное меню
+        objects = self.objects
+        cancel_area = objects.viewport.cancel_click_area
+        back_area = objects.get_default_back_button()
+        invite_friend = objects.get_default_invite_friend_button()
+        get_reward = objects.get_default_invite_dayli_reward_get_button()
+        free_chest = objects.get_default_magazine_free_chest()
+        like_area = objects.get_default_kubok_free_rewards_like()
+        message_rewards = objects.get_default_message_free_rewards()
+        self._free_reward_steps = (
+            # Приглашения и Daily Rewards
+            (
+                (objects.get_default_invite_main_button(), invite_friend, 0),
+                (invite_friend, invite_friend, 0),
+                (REPEAT_CLICK, None, 1),
+                (objects.get_default_invite_dayli_reward_button(), get_reward, 0),
+                (get_reward, None, 3),
+                (REPEAT_CLICK, None, 1),
+                (cancel_area, None, 1),
+                (back_area, None, 0.5),
+            ),
+            # Бесплатный сундук в магазине
+            (
+                (objects.get_default_magazine_button(), free_chest, 0),
+                (free_chest, None, 2),
+                (REPEAT_CLICK, None, 1),
+                (cancel_area, None, 0),
+            ),
+            # Лайк в разделе "Кубок"
+            (
+                (objects.get_default_kubok_free_rewards_area(), like_area, 0),
+                (like_area, None, 1),
+                (REPEAT_CLICK, None, 1),
+                (back_area, None, 0.5),
+            ),
+            # Награды в конверте (иконка по фиксированным координатам)
+            (
+                ((92, 66), message_rewards, 0),
+                (message_rewards, None, 1),
+                (REPEAT_CLICK, None, 1),
+                (cancel_area, None, 1),
+            ),
+        )
 
 
 # РАЗДЕЛЕНИЕ БЛОКА ОБЩИЙ ФУНКЦИЙ
 # МЕЖДУ БЛОКАМИ ФУНКЦИЙ ЛОГИКИ
 # ДЛЯ ОТКРЫТИЯ ЗАДАНИЙ И СБОРА НАГРАД
 
+    # Функция получения CDP сессии для кликов
+    async def _get_cdp(self):
+        """Постоянная CDP сессия страницы (только Chromium)"""
+        if self._cdp is None:
+            self._cdp = await self.page.context.new_cdp_session(self.page)
+        return self._cdp
+
+    # Функция клика с инвалидацией кэша скриншотов
+    async def _click(self, x: float, y: float):
+        """
+        Клик по координатам через Input.dispatchMouseEvent постоянной CDP сессии.
+        После клика кэшированный кадр устаревает
+        """
+        try:
+            cdp = await self._get_cdp()
+            event = {"x": x, "y": y, "button": "left", "clickCount": 1}
+            await cdp.send("Input.dispatchMouseEvent", {"type": "mousePressed", **event})
+            # Короткое удержание кнопки, как при нажатии пальцем
+            await asyncio.sleep(random.uniform(0.05, 0.12))
+            await cdp.send("Input.dispatchMouseEvent", {"type": "mouseReleased", **event})
+        except Exception as e:
+            logger.warning(f"Клик через CDP не удался, используем page.mouse: {e}")
+            self._cdp = None
+            await self.page.mouse.click(x, y)
+        finally:
+            self.screen.invalidate_cache()
+
+    # Функция подготовки области к OCR
+    def _prep_for_ocr(self, image: np.ndarray) -> np.ndarray:
+        """Оттенки серого + CLAHE + адаптивная бинаризация перед поиском текста"""
+        gray = to_gray(image)
+        equalized = self._clahe.apply(gray)
+        return cv2.adaptiveThreshold(equalized, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                     cv2.THRESH_BINARY, 31, 10)
+
+    # Функция поиска текста в фоновом потоке
+    async def _find_text(self, image: np.ndarray, pattern, threshold: float,
+                         detect: bool = True) -> Tuple[bool, float]:
+        """
+        Подготовка области и OCR в пуле потоков, чтобы не блокировать event loop
+        (torch освобождает GIL во время вычислений).
+        detect=False для областей, уже обрезанных по кнопке: только распознаватель
+        """
+        # Перевод в серый выполняется до передачи в поток: полный кадр ScreenManager - это
+        # переиспользуемый буфер, и следующий скриншот может перезаписать его во время OCR
+        gray = to_gray(image)
+
+        def find():
+            return self.coordinator.check_text_in_area(
+                self._prep_for_ocr(gray), pattern, threshold=threshold, detect=detect
+            )
+        return await asyncio.to_thread(find)
+
+    # Функция ожидания завершения анимации интерфейса
+    async def _wait_until_stable(self, region: Optional[BoxCoordinates] = None,
+                                 max_ms: int = 5000, poll_ms: int = 100,
+                                 stable_frames: int = 3,
+                                 baseline: Optional[np.ndarray] = None) -> bool:
+        """
+        Ожидание, пока область перестанет меняться, вместо фиксированной паузы.
+        Область считается стабильной после stable_frames подряд кадров
+        со средней разницей меньше 2 уровней яркости.
+        Если передан baseline (кадр области до клика), сначала ждем, пока область
+        от него отличится, иначе ожидание закончилось бы еще до начала перехода
+
+        Returns:
+            bool: True если область успокоилась, False по таймауту
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + max_ms / 1000
+        previous = None
+        stable = 0
+        changed = baseline is None
+        while loop.time() < deadline:
+            current = await self.screen.take_screenshot(region)
+            if current is not None and not changed:
+                changed = (current.shape != baseline.shape
+                           or cv2.absdiff(current, baseline).mean() >= 2.0)
+            elif current is not None and previous is not None and current.shape == previous.shape:
+                stable = stable + 1 if cv2.absdiff(current, previous).mean() < 2.0 else 0
+                if stable >= stable_frames:
+                    return True
+            previous = current
+            await asyncio.sleep(poll_ms / 1000)
+        logger.debug(f"Область не {'стабилизировалась' if changed else 'изменилась'} за {max_ms} мс")
+        return False
+
     # Функция выполнения нажатия на "Задания"
     async def click_task_button(self) -> bool:
         """Нажатие на кнопку 'Задание'"""
@@ -61,9 +224,8 @@ class TaskActions:
             
         logger.debug(f"Выбраны координаты для клика по заданию: {task_coords}")
         
-        await HumanBehavior.random_delay()
-        await self.page.mouse.click(task_coords[0], task_coords[1])
-        await HumanBehavior.random_delay()
+        await self._click(task_coords[0], task_coords[1])
+        await HumanBehavior.combined_delay(2)
         return True
 
     # Функция выхода в безопасную зону если мы не в главном меню
@@ -84,29 +246,37 @@ class TaskActions:
         logger.debug(f"Выбраны координаты для safe click: {safe_coords}")
         
         await HumanBehavior.random_delay()
-        await self.page.mouse.click(safe_coords[0], safe_coords[1])
+        await self._click(safe_coords[0], safe_coords[1])
+
+    # Функция гарантированного возврата в главное меню
+    async def _ensure_main_menu(self, *, retries: int = 1) -> bool:
+        """Проверка главного меню с попытками вернуться в него через безопасную зону"""
+        if await self.chest_actions.main_menu():
+            return True
+
+        for _ in range(retries):
+            logger.warning("Не в главном меню, возвращаемся")
+            await self.back_to_main_menu()
+            await asyncio.sleep(1)
+            await HumanBehavior.random_delay()
+            if await self.chest_actions.main_menu():
+                return True
+
+        logger.error("Не удалось вернуться в главное меню")
+        return False
 
     # Функция проверки окна для продолжения после действий 
     async def click_to_continue(self) -> bool:
         """Обработка кликов для продолжения"""
         try:
             logger.info("Проверка необходимости клика для продолжения")
-            image = await self.screen.take_screenshot()
+            image = await self.screen.take_screenshot(use_cache=True)
             if image is None:
                 logger.error("Не удалось получить скриншот")
                 return False
             
             # Проверяем наличие текста
-            continue_texts = [
-                'нажмите', 'область', 'закрыть',
-                'click', 'area', 'close'
-            ]
-            
-            result, confidence = self.coordinator.check_text_in_area(
-                image,
-                continue_texts,
-                threshold=0.2
-            )
+            result, confidence = await self._find_text(image, self._continue_pattern, threshold=0.2)
             
             if result and confidence > 0.6:
                 logger.info(f"Обнаружен текст для продолжения (confidence: {confidence:.2f})")
@@ -120,7 +290,7 @@ class TaskActions:
                 
                 logger.debug(f"Выполняем клик для продолжения: {safe_coords}")
                 await HumanBehavior.random_delay()
-                await self.page.mouse.click(safe_coords[0], safe_coords[1])
+                await self._click(safe_coords[0], safe_coords[1])
                 await asyncio.sleep(0.7)
                 return True
             
@@ -163,40 +333,37 @@ class TaskActions:
             return False
 
     # Функция проверки нахождения в меню заданий
-    async def check_task_menu(self, retry_count=0) -> bool:
+    async def check_task_menu(self, attempts: int = 2) -> bool:
         """
         Проверка нахождения в меню заданий
         Нужно изменить логику проверки самой кнопки и ее совпадений
         Через CV manager.
         """
         try:
-            image = await self.screen.take_screenshot()
-            if image is None:
-                logger.error("Не удалось получить скриншот")
-                return False
-                
-            # Проверяем наличие текста "Daily Task" в области
             task_area = self.objects.get_default_dayli_task_button()
-            result, confidence = self.coordinator.check_text_in_area(
-                image,
-                ['Dayli task', 'Task', 'Dally' 'task', 'начать', 'получен', 'start', 'get', 'Permanent Task'],
-                task_area,
-                threshold=0.45
-            )
-            
-            logger.debug(f"Проверка меню заданий: {result} (confidence: {confidence:.2f})")
-            
-            # Если первая попытка не удалась, пробуем еще раз
-            if not result and retry_count == 0:
-                logger.info("Первая попытка проверки меню не удалась, пробуем еще раз")
-                await asyncio.sleep(1.0)  # Добавляем задержку перед повторной попыткой
-                return await self.check_task_menu(retry_count=1)
-            # Если вторая попытка не удалась, перезапускаем process_daily_tasks
-            elif not result and retry_count == 1:
-                logger.warning("Вторая попытка проверки меню не удалась, перезапускаем process_daily_tasks")
-                await self.process_daily_tasks()
+            result = False
+
+            for attempt in range(attempts):
+                if attempt > 0:
+                    logger.info("Первая попытка проверки меню не удалась, пробуем еще раз")
+                    await asyncio.sleep(1.0)  # Добавляем задержку перед повторной попыткой
+
+                # OCR выполняется только по области кнопки Daily Task
+                roi = await self.screen.take_screenshot(task_area, use_cache=True)
+                if roi is None:
+                    logger.error("Не удалось получить скриншот")
+                    return False
+                    
+                # Проверяем наличие текста "Daily Task" в области
+                result, confidence = await self._find_text(roi, self._task_menu_pattern, threshold=0.45, detect=False)
                 
-            return result
+                logger.debug(f"Проверка меню заданий: {result} (confidence: {confidence:.2f})")
+                if result:
+                    return True
+
+            # Повтор всего сценария выполняет цикл в process_daily_tasks
+            logger.warning("Все попытки проверки меню заданий не удались")
+            return False
             
         except Exception as e:
             logger.error(f"Ошибка при проверке меню заданий: {e}")
@@ -207,8 +374,8 @@ class TaskActions:
         """Открытие меню ежедневных заданий"""
         try:
             logger.info("Начало открытия меню ежедневных заданий")
-            # Клик по кнопке заданий
-            await asyncio.sleep(10.0)
+            # Ждем, пока главный экран перестанет меняться, затем кликаем по кнопке заданий
+            await self._wait_until_stable(max_ms=10000)
             if not await self.click_task_button():
                 return False
             
@@ -221,7 +388,7 @@ class TaskActions:
             # Выполняем клик
             logger.info(f"Выполнение клика по кнопке Daily Task: {coords}")
             await HumanBehavior.random_delay()
-            await self.page.mouse.click(coords[0], coords[1])
+            await self._click(coords[0], coords[1])
             
             # Ждем загрузки вкладки заданий
             logger.info("Ожидание загрузки вкладки заданий")
@@ -239,24 +406,27 @@ class TaskActions:
         """Проверка наличия доступных наград"""
         try:
             logger.info("Начало проверки наличия доступных наград")
-            '''
-            # Получаем область наград и расширяем её на 40%
+            # Получаем область наград и расширяем её на 40%,
+            # OCR выполняется только по этой области
             rewards_area = self.objects.get_default_daily_task_rewards_button()
             expanded_area = self.objects.expand_area(rewards_area, 0.4)
-            screenshot = await self.screen.take_screenshot(expanded_area)
-            '''
-            screenshot = await self.screen.take_screenshot()
+            screenshot = await self.screen.take_screenshot(expanded_area, use_cache=True)
             if screenshot is None:
                 logger.error("Не удалось получить скриншот области наград")
                 return False
-                
-            # Проверяем наличие текста "Получить"
-            result, confidence = self.coordinator.check_text_in_area(
-                screenshot,
-                ['получ', 'получить', 'get'],
-                threshold=0.6
-            )
-            logger.debug(f"Проверка наличия доступных наград: {result} (confidence: {confidence:.2f})")
+
+            # Сначала дешёвое сравнение с шаблоном кнопки, OCR только в зоне неопределённости
+            score = self.cv_manager.match_daily_task_reward_button(screenshot)
+            if score > self.REWARD_TEMPLATE_HIT:
+                logger.info(f"Обнаружены доступные награды (шаблон: {score:.2f})")
+                return True
+            if score < self.REWARD_TEMPLATE_MISS:
+                logger.debug(f"Кнопка получения награды не найдена по шаблону ({score:.2f})")
+                result = False
+            else:
+                # Проверяем наличие текста "Получить"
+                result, confidence = await self._find_text(screenshot, self._rewards_pattern, threshold=0.6, detect=False)
+                logger.debug(f"Проверка наличия доступных наград: {result} (confidence: {confidence:.2f})")
 
             if result:
                 logger.info("Обнаружены доступные награды")
@@ -274,22 +444,22 @@ class TaskActions:
             return False
             
     # Функция сбора наград за ежедневные задания
-    async def collect_rewards(self) -> bool:
+    async def collect_rewards(self, max_iterations: int = 20) -> TaskResult:
         """Сбор наград за ежедневные задания"""
         try:
             logger.info("Начало сбора наград")
-            while True:
+            for _ in range(max_iterations):
                 # Проверяем наличие наград
                 if not await self.check_rewards_available():
                     logger.info("Нет доступных наград")
-                    return 'done'  # Возвращаем True, так как все награды собраны
+                    return TaskResult.DONE  # Все награды собраны
 
                 # Нажимаем повторно на вкладку   
                 logger.info("Нажимаем повторно на кнопку Daily Task")
                 daily_task_area = self.objects.get_default_dayli_task_button()
                 coords_task = self.objects.get_random_point_in_area(daily_task_area)
                 await HumanBehavior.random_delay()
-                await self.page.mouse.click(coords_task[0], coords_task[1])
+                await self._click(coords_task[0], coords_task[1])
                 await asyncio.sleep(0.5)
 
                 # Получаем координаты кнопки наград
@@ -298,15 +468,17 @@ class TaskActions:
                 
                 # Выполняем клик
                 await HumanBehavior.random_delay()
-                await self.page.mouse.click(coords[0], coords[1])
+                await self._click(coords[0], coords[1])
                 
                 # Ждем анимацию получения наград
                 await asyncio.sleep(0.7)
-                await self.collect_rewards()
+
+            logger.warning(f"Достигнут лимит итераций сбора наград: {max_iterations}")
+            return TaskResult.DONE
                 
         except Exception as e:
             logger.error(f"Ошибка при сборе наград: {e}")
-            return False
+            return TaskResult.ERROR
             
 
 
@@ -316,13 +488,13 @@ class TaskActions:
 
 
     # Основная функция обработки ежедневных заданий
-    async def process_daily_tasks(self) -> str:
+    async def process_daily_tasks(self) -> TaskResult:
         """Основная функция обработки ежедневных заданий
         
         Returns:
-            'continue' - если награды собраны успешно
-            'done' - если нет доступных наград
-            'error' - если произошла ошибка
+            TaskResult.CONTINUE - если награды собраны успешно
+            TaskResult.DONE - если нет доступных наград
+            TaskResult.ERROR - если произошла ошибка
         """
         try:
             logger.info("Начало обработки ежедневных заданий")
@@ -331,26 +503,37 @@ class TaskActions:
             free_rewards_result = await self.process_free_dayli_rewards()
             if not free_rewards_result:
                 logger.error("Ошибка при обработке бесплатных наград")
-                return 'done'
+                return TaskResult.DONE
 
-            # Проверка главного меню
-            if not await self.chest_actions.main_menu():
-                logger.warning("Не в главном меню")
-                await self.back_to_main_menu()
-                await asyncio.sleep(0.5)
-                return await self.process_daily_tasks()
+            # Ограниченное число попыток дойти до меню заданий вместо рекурсивного перезапуска
+            for attempt in range(self.MAX_DAILY_TASK_ATTEMPTS):
+                if attempt > 0:
+                    logger.info(f"Повторная попытка открыть меню заданий ({attempt + 1}/{self.MAX_DAILY_TASK_ATTEMPTS})")
 
-            # Проверяем наличие доступных наград
-            if not await self.check_daily_rewards():
-                logger.info("Нет доступных наград")
+                # Проверка главного меню
+                if not await self.chest_actions.main_menu():
+                    logger.warning("Не в главном меню")
+                    await self.back_to_main_menu()
+                    await asyncio.sleep(0.5)
+                    continue
+
+                # Проверяем наличие доступных наград
+                if not await self.check_daily_rewards():
+                    logger.info("Нет доступных наград")
+                    await self.back_to_main_menu()
+                    await HumanBehavior.random_delay()
+                    return TaskResult.DONE
+
+                # Открываем меню заданий
+                if await self.open_daily_tasks():
+                    break
+
+                logger.warning("Не удалось открыть меню заданий")
                 await self.back_to_main_menu()
-                await HumanBehavior.random_delay()
-                return 'done'
-            
-            # Открываем меню заданий
-            if not await self.open_daily_tasks():
-                logger.error("Не удалось открыть меню заданий")
-                return 'done'
+                await asyncio.sleep(0.5)
+            else:
+                logger.error("Не удалось открыть меню заданий за все попытки")
+                return TaskResult.DONE
             
             # Проверяем наличие наград
             await asyncio.sleep(1.4)
@@ -358,22 +541,22 @@ class TaskActions:
                 logger.info("Нет доступных наград")
                 await self.back_to_main_menu()
                 await HumanBehavior.random_delay()
-                return 'done'
+                return TaskResult.DONE
             
             # Собираем награды
-            if not await self.collect_rewards():
+            if await self.collect_rewards() == TaskResult.ERROR:
                 logger.error("Не удалось собрать награды")
                 await self.back_to_main_menu()
                 await HumanBehavior.random_delay()
-                return 'done'
+                return TaskResult.DONE
             
             logger.info("Обработка всех наград завершена")
 
-            return 'continue'
+            return TaskResult.CONTINUE
             
         except Exception as e:
             logger.error(f"Ошибка при обработке ежедневных заданий: {e}")
-            return 'error'
+            return TaskResult.ERROR
 
     # Глобальная функция сбора разных бесплатных плюшек 
     async def process_free_dayli_rewards(self) -> bool:
@@ -385,184 +568,31 @@ class TaskActions:
         try:
             logger.info("Начало процесса сбора бесплатных наград")
 
-            # Проверяем, что мы в главном меню перед началом
-            if not await self.chest_actions.main_menu():
-                logger.warning("Не в главном меню, возвращаемся")
-                await self.back_to_main_menu()
-                await asyncio.sleep(1)
-                await HumanBehavior.random_delay()
-                if not await self.chest_actions.main_menu():
-                    logger.error("Не удалось вернуться в главное меню перед началом сбора наград")
-                    return False
-
-            # Нажимаем на кнопку "Пригласить"
-            invite_invite_main = self.objects.get_default_invite_main_button()
-            invite_main_coords = self.objects.get_random_point_in_area(invite_invite_main)
-            await HumanBehavior.random_delay()
-            await self.page.mouse.click(invite_main_coords[0], invite_main_coords[1])
-            await asyncio.sleep(5)
-
-            # Нажимаем на кнопку "Пригласить друга"
-            invite_friend = self.objects.get_default_invite_friend_button()
-            invite_friend_coords = self.objects.get_random_point_in_area(invite_friend)
-            await HumanBehavior.random_delay()
-            await self.page.mouse.click(invite_friend_coords[0], invite_friend_coords[1])
-            await asyncio.sleep(5)
-
-            # Повторный клик
-            await HumanBehavior.random_delay()
-            await self.page.mouse.click(invite_friend_coords[0], invite_friend_coords[1])
-            await asyncio.sleep(1)
-
-            # Нажимаем на кнопку "Daily Rewards"
-            dayli_reward =  self.objects.get_default_invite_dayli_reward_button()
-            dayli_reward_coords = self.objects.get_random_point_in_area(dayli_reward)
-            await HumanBehavior.random_delay()
-            await self.page.mouse.click(dayli_reward_coords[0], dayli_reward_coords[1])
-            await asyncio.sleep(5)
-
-            # Нажимаем на кнопку "Получить"
-            get_reward_get =  self.objects.get_default_invite_dayli_reward_get_button()
-            get_reward_coords = self.objects.get_random_point_in_area(get_reward_get)
-            await HumanBehavior.random_delay()
-            await self.page.mouse.click(get_reward_coords[0], get_reward_coords[1])
-            await asyncio.sleep(3)
-
-            # Повторный клик
-            await HumanBehavior.random_delay()
-            await self.page.mouse.click(get_reward_coords[0], get_reward_coords[1])
-            await asyncio.sleep(1)
-
-            # Нажимаем на область отмены
-            cancel_area = self.objects.viewport.cancel_click_area
-            cancel_coords = self.objects.get_random_point_in_area(cancel_area)
-            await HumanBehavior.random_delay()
-            await self.page.mouse.click(cancel_coords[0], cancel_coords[1])
-            await asyncio.sleep(1)
-
-            # Нажимаем на кнопку "Назад"
-            back_button = self.objects.get_default_back_button()
-            back_button_coords = self.objects.get_random_point_in_area(back_button)
-            await HumanBehavior.random_delay()
-            await self.page.mouse.click(back_button_coords[0], back_button_coords[1])
-            await asyncio.sleep(0.5)
-
-            # Проверяем, что мы в главном меню после приглашений
-            if not await self.chest_actions.main_menu():
-                logger.warning("Не в главном меню, возвращаемся")
-                await self.back_to_main_menu()
-                await asyncio.sleep(1)
-                await HumanBehavior.random_delay()
-                if not await self.chest_actions.main_menu():
-                    logger.error("Не удалось вернуться в главное меню перед началом сбора наград")
+            for group in self._free_reward_steps:
+                # Каждая группа начинается из главного меню
+                if not await self._ensure_main_menu():
                     return False
 
-            # Нажимаем на кнопку "Магазин"
-            magazine_coord = self.objects.get_default_magazine_button()
-            magazine_coords = self.objects.get_random_point_in_area(magazine_coord)
-            await HumanBehavior.random_delay()
-            await self.page.mouse.click(magazine_coords[0], magazine_coords[1])
-            await asyncio.sleep(5)
-
-            # Нажимаем на кнопку "Получить сундук"
-            free_chest = self.objects.get_default_magazine_free_chest()
-            free_chest_coords = self.objects.get_random_point_in_area(free_chest)
-            await HumanBehavior.random_delay()
-            await self.page.mouse.click(free_chest_coords[0], free_chest_coords[1])
-            await asyncio.sleep(2)
-
-            # Повторный клик
-            await HumanBehavior.random_delay()
-            await self.page.mouse.click(free_chest_coords[0], free_chest_coords[1])
-            await asyncio.sleep(1)
-
-            # Нажимаем на область отмены
-            await HumanBehavior.random_delay()
-            await self.page.mouse.click(cancel_coords[0], cancel_coords[1])
-
-            # Проверка главного меню
-            if not await self.chest_actions.main_menu():
-                logger.warning("Не в главном меню, возвращаемся")
-                await self.back_to_main_menu()
-                await asyncio.sleep(1)
-                await HumanBehavior.random_delay()
-                if not await self.chest_actions.main_menu():
-                    logger.error("Не удалось вернуться в главное меню перед началом сбора наград")
-                    return False
-
-            # Нажимаем на кнопку "Кубок"
-            kubok_area = self.objects.get_default_kubok_free_rewards_area()
-            kubok_coords = self.objects.get_random_point_in_area(kubok_area)
-            await HumanBehavior.random_delay()
-            await self.page.mouse.click(kubok_coords[0], kubok_coords[1])
-            await asyncio.sleep(5)
-
-            # Нажимаем на кнопку "Лайк"
-            like_area = self.objects.get_default_kubok_free_rewards_like()
-            like_coords = self.objects.get_random_point_in_area(like_area)
-            await HumanBehavior.random_delay()
-            await self.page.mouse.click(like_coords[0], like_coords[1])
-            await asyncio.sleep(1)
-
-            # Повторный клик на "Лайк"
-            await HumanBehavior.random_delay()
-            await self.page.mouse.click(like_coords[0], like_coords[1])
-            await asyncio.sleep(1)
-
-            # Нажимаем на кнопку "Назад"
-            back_button = self.objects.get_default_back_button()
-            back_coords = self.objects.get_random_point_in_area(back_button)
-            await HumanBehavior.random_delay()
-            await self.page.mouse.click(back_coords[0], back_coords[1])
-            await asyncio.sleep(0.5)
-
-            # Еще одна проверка главного меню
-            if not await self.chest_actions.main_menu():
-                logger.warning("Не в главном меню, возвращаемся")
-                await self.back_to_main_menu()
-                await asyncio.sleep(1)
-                await HumanBehavior.random_delay()
-                if not await self.chest_actions.main_menu():
-                    logger.error("Не удалось вернуться в главное меню")
-                    return False
-
-            # Клик на фиксированные координаты
-            await HumanBehavior.random_delay()
-            await self.page.mouse.click(92, 66)
-            await asyncio.sleep(5)
-
-            # Клик на кнопку сбора вознаграждений в конверте
-            message_rewards = self.objects.get_default_message_free_rewards()
-            message_coords = self.objects.get_random_point_in_area(message_rewards)
-            await HumanBehavior.random_delay()
-            await self.page.mouse.click(message_coords[0], message_coords[1])
-            await asyncio.sleep(1)
-
-            # Повторный клик на ту же область
-            await HumanBehavior.random_delay()
-            await self.page.mouse.click(message_coords[0], message_coords[1])
-            await asyncio.sleep(1)
-
-            # Клик на область отмены
-            cancel_area = self.objects.viewport.cancel_click_area
-            cancel_coords = self.objects.get_random_point_in_area(cancel_area)
-            await HumanBehavior.random_delay()
-            await self.page.mouse.click(cancel_coords[0], cancel_coords[1])
-            await asyncio.sleep(1)
-
-            # Еще одна проверка главного меню
-            if not await self.chest_actions.main_menu():
-                logger.warning("Не в главном меню, возвращаемся")
-                await self.back_to_main_menu()
-                await asyncio.sleep(1)
-                await HumanBehavior.random_delay()
-                if not await self.chest_actions.main_menu():
-                    logger.error("Не удалось вернуться в главное меню")
-                    return False
+                coords = None
+                for target, settle_area, base in group:
+                    if target is not REPEAT_CLICK:
+                        coords = (self.objects.get_random_point_in_area(target)
+                                  if isinstance(target, BoxCoordinates) else target)
+                    # Кадр области до клика, чтобы дождаться начала перехода
+                    baseline = (await self.screen.take_screenshot(settle_area)
+                                if settle_area is not None else None)
+                    await self._click(coords[0], coords[1])
+                    if settle_area is not None:
+                        await self._wait_until_stable(settle_area, baseline=baseline)
+                    await HumanBehavior.combined_delay(1, base=base)
+
+            # Проверяем, что мы вернулись в главное меню
+            if not await self._ensure_main_menu():
+                return False
 
             logger.info("Процесс сбора бесплатных наград завершен успешно")
             return True
 
         except Exception as e:
             logger.error(f"Ошибка в процессе сбора бесплатных наград: {e}")
-            return False
\ No newline at end of file
+            return False
@@ -1,6 +1,11 @@
 import asyncio
+import functools
+import random
+import re
+import textwrap
+import time
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple, Final
 from loguru import logger
 from playwright.async_api import async_playwright, Browser, Page, BrowserContext
 from utils import ScreenRecorder, HumanBehavior
@@ -9,58 +14,336 @@ from web_modules import GameCanvasHandler
 from device_emulation import get_telegram_device_config
 from bombie.bot_logic import WebAppLogic
 from dotenv import load_dotenv
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
 import os
 
 # Загрузка переменных окружения
 load_dotenv()
 
 # Получение настроек из .env
-ENABLE_SCREENSHOTS = os.getenv('ENABLE_SCREENSHOTS', 'false').lower() == 'true'
-ENABLE_VIDEO = os.getenv('ENABLE_VIDEO', 'false').lower() == 'true'
-ENABLE_TRACING = os.getenv('ENABLE_TRACING', 'false').lower() == 'true'
-ENABLE_LOGGING = os.getenv('ENABLE_LOGGING', 'true').lower() == 'true'
-ENABLE_HEADLESS = os.getenv('ENABLE_HEADLESS', 'false').lower() == 'true'
+ENABLE_SCREENSHOTS: Final[bool] = os.getenv('ENABLE_SCREENSHOTS', 'false').lower() == 'true'
+ENABLE_VIDEO: Final[bool] = os.getenv('ENABLE_VIDEO', 'false').lower() == 'true'
+ENABLE_TRACING: Final[bool] = os.getenv('ENABLE_TRACING', 'false').lower() == 'true'
+ENABLE_LOGGING: Final[bool] = os.getenv('ENABLE_LOGGING', 'true').lower() == 'true'
+ENABLE_HEADLESS: Final[bool] = os.getenv('ENABLE_HEADLESS', 'false').lower() == 'true'
+ENABLE_DEBUG_LOG: Final[bool] = os.getenv('ENABLE_DEBUG_LOG', 'false').lower() == 'true'
+
+# Идентификатор файлового sink'а loguru (добавляется один раз на процесс)
+_file_sink_id: Optional[int] = None
+
+
+def _setup_file_logging():
+    """
+    Файловое логирование обработчика. Sink добавляется один раз: раньше каждый
+    BotHandler регистрировал новый sink, и записи дублировались
+    """
+    global _file_sink_id
+    if not ENABLE_LOGGING or _file_sink_id is not None:
+        return
+    # Запись в файл из фонового потока loguru, без обхода стека на каждую запись
+    _file_sink_id = logger.add(
+        "logs/bot_handler_{time}.log",
+        rotation="1 day",
+        retention="7 days",
+        level="DEBUG" if ENABLE_DEBUG_LOG else "INFO",
+        enqueue=True,
+        backtrace=False,
+        diagnose=False,
+        compression="zip",
+    )
 
 # Статические настройки
 MAX_RECONNECT_ATTEMPTS = 3
 RECONNECT_DELAY = 5
+# Интервал проверки доступности WebApp через page.evaluate (секунды)
+HEALTHCHECK_INTERVAL = 5.0
+# Минимальный период основного цикла и период скриншотов мониторинга (секунды)
+MIN_LOOP_PERIOD = float(os.getenv('LOOP_PERIOD_S', '1.0'))
+SCREENSHOT_INTERVAL = float(os.getenv('SCREENSHOT_INTERVAL_S', '10.0'))
 
 # Размеры viewport и окна браузера
 VIEWPORT_WIDTH = 412
 VIEWPORT_HEIGHT = 815
 
+# SDK Telegram WebApp
+TELEGRAM_WEBAPP_JS_URL = 'https://telegram.org/js/telegram-web-app.js'
+
+# Init-скрипт контекста: внедряет telegram-web-app.js в head, вешает обработчики событий WebApp,
+# вызывает ready()/expand() и сохраняет статус инициализации в window.__initStatus.
+# Выполняется до скриптов страницы, поэтому заменяет отдельные page.evaluate после goto
+WEBAPP_INIT_JS = textwrap.dedent("""
+(() => {
+    if (window.top !== window) return;
+
+    const setupEventHandlers = (tg) => {
+        const events = [
+            'themeChanged',
+            'viewportChanged',
+            'mainButtonClicked',
+            'backButtonClicked',
+            'settingsButtonClicked',
+            'invoiceClosed',
+            'popupClosed',
+            'qrTextReceived'
+        ];
+
+        events.forEach(event => {
+            tg.onEvent(event, (data) => {
+                window.telegramTracker?.logEvent({
+                    type: 'telegram_event',
+                    event_name: event,
+                    data: data,
+                    timestamp: Date.now(),
+                    source: 'telegram_webapp'
+                });
+            });
+        });
+
+        // Отдельно отслеживаем изменение основных параметров
+        tg.onEvent('mainButtonClicked', () => {
+            if (tg.MainButton) {
+                window.telegramTracker?.logEvent({
+                    type: 'telegram_state',
+                    component: 'MainButton',
+                    state: {
+                        isVisible: tg.MainButton.isVisible,
+                        text: tg.MainButton.text,
+                        color: tg.MainButton.color,
+                        textColor: tg.MainButton.textColor
+                    }
+                });
+            }
+        });
+        tg.onEvent('backButtonClicked', () => {
+            if (tg.BackButton) {
+                window.telegramTracker?.logEvent({
+                    type: 'telegram_state',
+                    component: 'BackButton',
+                    state: {
+                        isVisible: tg.BackButton.isVisible
+                    }
+                });
+            }
+        });
+    };
+
+    const finish = () => {
+        const tg = window.Telegram?.WebApp;
+        if (tg) {
+            setupEventHandlers(tg);
+            tg.ready();
+            tg.expand();
+        }
+        window.__initStatus = {
+            initialized: !!tg,
+            version: tg?.version,
+            platform: tg?.platform,
+            colorScheme: tg?.colorScheme,
+            themeParams: tg?.themeParams,
+            isExpanded: tg?.isExpanded,
+            viewportHeight: tg?.viewportHeight,
+            viewportStableHeight: tg?.viewportStableHeight
+        };
+    };
+
+    const inject = () => {
+        // Страница уже подключила SDK сама (например, игра после редиректа)
+        if (window.Telegram?.WebApp) {
+            finish();
+            return;
+        }
+        const script = document.createElement('script');
+        script.src = '%s';
+        script.onload = finish;
+        script.onerror = () => {
+            console.error('Failed to load WebApp script');
+            window.__initStatus = { initialized: false };
+        };
+        // Вставляем скрипт в начало head
+        const head = document.head || document.documentElement;
+        head.insertBefore(script, head.firstChild);
+    };
+
+    if (document.readyState === 'loading') {
+        document.addEventListener('DOMContentLoaded', inject, { once: true });
+    } else {
+        inject();
+    }
+})();
+""").strip() % TELEGRAM_WEBAPP_JS_URL
+
+# Короткие выражения для page.evaluate / wait_for_function
+INIT_STATUS_JS = "() => window.__initStatus"
+INIT_FLAG_JS = "status => status.initialized"
+WEBAPP_AVAILABLE_JS = "() => !!window.Telegram?.WebApp"
+WEBAPP_READY_JS = "() => { window.Telegram.WebApp.ready(); window.Telegram.WebApp.expand(); }"
+
+# URL игры, на который WebApp выполняет редирект
+GAME_URL_PATTERN = re.compile(r"games\.pluto\.vision")
+
+# Настройки пула браузеров
+BROWSER_POOL_SIZE = int(os.getenv('BROWSER_POOL_SIZE', '1'))
+BROWSER_POOL_RECYCLE_AFTER = int(os.getenv('BROWSER_POOL_RECYCLE_AFTER', '100'))
+
+
+@functools.lru_cache(maxsize=1)
+def _playwright_ready(cache_dir: str) -> bool:
+    """Есть ли установленный chromium в кэше Playwright (результат кэшируется на время процесса)"""
+    with os.scandir(cache_dir) as entries:
+        return any(entry.name.startswith('chromium-') and entry.is_dir() for entry in entries)
+
+
+# Общая задача проверки установки браузера (успешный результат действует весь процесс)
+_install_task: Optional[asyncio.Task] = None
+_install_lock = asyncio.Lock()
+
+
+class BrowserPool:
+    """
+    Пул запущенных Chromium, общий для всех вызовов handle_webapp.
+    Каждый запуск бота получает новый контекст в уже запущенном браузере,
+    браузер перезапускается после BROWSER_POOL_RECYCLE_AFTER контекстов
+    """
+
+    def __init__(self, size: int = BROWSER_POOL_SIZE, recycle_after: int = BROWSER_POOL_RECYCLE_AFTER):
+        self._size = max(1, size)
+        self._recycle_after = recycle_after
+        self._playwright = None
+        self._idle: list[Browser] = []
+        self._contexts_served: Dict[Browser, int] = {}
+        self._lock = asyncio.Lock()
+
+    async def _launch(self) -> Browser:
+        """Запуск Chromium с размерами окна под viewport"""
+        browser = await self._playwright.chromium.launch(
+            headless=ENABLE_HEADLESS,
+            args=[
+                f'--window-size={VIEWPORT_WIDTH},{VIEWPORT_HEIGHT}',
+                '--force-device-scale-factor=1',
+                '--mute-audio',
+                '--hide-scrollbars',
+                '--window-position=0,0'
+            ]
+        )
+        self._contexts_served[browser] = 0
+        logger.info(f"Chromium браузер запущен с размерами: {VIEWPORT_WIDTH}x{VIEWPORT_HEIGHT}")
+        return browser
+
+    async def _prelaunch(self):
+        """Запуск Playwright и параллельный запуск браузеров пула"""
+        self._playwright = await async_playwright().start()
+        logger.debug("Playwright успешно инициализирован")
+        self._idle.extend(await asyncio.gather(*(self._launch() for _ in range(self._size))))
+
+    async def acquire(self, **context_options) -> BrowserContext:
+        """Новый контекст в свободном браузере пула (при нехватке браузер запускается)"""
+        async with self._lock:
+            if self._playwright is None:
+                await self._prelaunch()
+
+            browser = None
+            while self._idle and browser is None:
+                candidate = self._idle.pop()
+                if candidate.is_connected():
+                    browser = candidate
+                else:
+                    self._contexts_served.pop(candidate, None)
+            if browser is None:
+                browser = await self._launch()
+
+            self._contexts_served[browser] += 1
+
+        return await browser.new_context(**context_options)
+
+    async def release(self, context: BrowserContext):
+        """Закрытие контекста и возврат браузера в пул"""
+        browser = context.browser
+        try:
+            await context.close()
+        except Exception as e:
+            logger.debug(f"Контекст уже закрыт: {e}")
+
+        async with self._lock:
+            if browser is None or not browser.is_connected():
+                # Браузер закрыт (например, вручную) - в пул не возвращаем
+                self._contexts_served.pop(browser, None)
+                return
+
+            if self._contexts_served.get(browser, 0) >= self._recycle_after:
+                logger.info(f"Перезапуск браузера после {self._recycle_after} контекстов")
+                self._contexts_served.pop(browser, None)
+                await browser.close()
+                browser = await self._launch()
+
+            self._idle.append(browser)
+
+    async def close(self):
+        """Закрытие всех браузеров пула и остановка Playwright"""
+        async with self._lock:
+            for browser in list(self._contexts_served):
+                try:
+                    await browser.close()
+                except Exception as e:
+                    logger.debug(f"Ошибка закрытия браузера пула: {e}")
+            self._idle.clear()
+            self._contexts_served.clear()
+            if self._playwright:
+                await self._playwright.stop()
+                self._playwright = None
+
+
+# Общий пул браузеров процесса
+BROWSER_POOL = BrowserPool()
+
 class BotHandler:
     def __init__(self, webapp_url: str):
         self.webapp_url = webapp_url
-        self.playwright = None
+        # URL с нужной версией WebApp вычисляется один раз и используется во всех попытках
+        self._normalized_url = self._normalize_webapp_url(webapp_url)
         self.browser: Optional[Browser] = None
         self.context: Optional[BrowserContext] = None
         self.page: Optional[Page] = None
         self.device_config = get_telegram_device_config()
-        self.tracer: Optional[TracerManager] = None
-        self.recorder: Optional[ScreenRecorder] = None
+        # Трейсер и запись создаются лениво при первом обращении
+        self._tracer: Optional[TracerManager] = None
+        self._recorder: Optional[ScreenRecorder] = None
         self.human: HumanBehavior = HumanBehavior()
         self.is_running = False
         self.reconnect_attempts = 0
+        # Состояние страницы и браузера обновляется событиями Playwright
+        self._page_closed = False
+        self._browser_disconnected = False
+        self._last_healthcheck = 0.0
+        self._screenshot_task: Optional[asyncio.Task] = None
+        # Обработчик canvas текущей страницы (останавливается в cleanup и перед созданием нового)
+        self._canvas_handler: Optional[GameCanvasHandler] = None
 
         # Настройка логирования в зависимости от ENABLE_LOGGING
-        if ENABLE_LOGGING:
-            logger.add(
-                "logs/bot_handler_{time}.log",
-                rotation="1 hour",
-                retention="7 days",
-                level="DEBUG",
-                backtrace=True,
-                diagnose=True,
-            )
+        _setup_file_logging()
+
+    async def check_browser_installation(self) -> bool:
+        """
+        Проверка установки браузера один раз на процесс: параллельные и последующие
+        вызовы (в том числе при переподключении) ждут одну и ту же задачу.
+        Неудачный результат не кэшируется
+        """
+        global _install_task
+        async with _install_lock:
+            if _install_task is None:
+                _install_task = asyncio.create_task(self._check_browser_installation())
+            task = _install_task
 
-    async def check_browser_installation(self):
+        installed = await task
+        if not installed:
+            async with _install_lock:
+                if _install_task is task:
+                    _install_task = None
+        return installed
+
+    async def _check_browser_installation(self) -> bool:
         """Проверка установки браузера"""
         try:
-            from playwright.async_api import async_playwright
-            import os
             import sys
-            import glob
             
             # Получаем путь к виртуальному окружению
             project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -72,58 +355,53 @@ class BotHandler:
             # Устанавливаем переменную окружения для кэша Playwright
             os.environ['PLAYWRIGHT_BROWSERS_PATH'] = playwright_cache
             
-            try:
-                # Проверяем наличие браузера через glob
-                browser_path = os.path.join(playwright_cache, 'chromium-*')
-                if not glob.glob(browser_path):
-                    raise Exception("Executable doesn't exist")
-                    
-                playwright = await async_playwright().start()
-                await playwright.stop()
+            # Наличие chromium определяется по директории кэша, без пробного запуска Playwright
+            if _playwright_ready(playwright_cache):
                 logger.info(f"Браузер Playwright доступен в {playwright_cache}")
                 return True
-            except Exception as e:
-                if "Executable doesn't exist" in str(e):
-                    logger.warning("Браузеры Playwright не установлены, выполняем установку...")
-                    
-                    # Используем путь к Python из виртуального окружения
-                    venv_python = os.path.join(project_root, 'python_env', 
-                                                'bin' if not sys.platform.startswith('win') else 'Scripts',
-                                                'python' + ('.exe' if sys.platform.startswith('win') else ''))
-                    
-                    process = subprocess.Popen(
-                        [venv_python, '-m', 'playwright', 'install', 'chromium'],
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE,
-                        env={'PLAYWRIGHT_BROWSERS_PATH': playwright_cache}
-                    )
-                    stdout, stderr = process.communicate()
-                    
-                    if process.returncode == 0:
-                        # Устанавливаем системные зависимости
-                        deps_process = subprocess.Popen(
-                            [venv_python, '-m', 'playwright', 'install-deps', 'chromium'],
-                            stdout=subprocess.PIPE,
-                            stderr=subprocess.PIPE,
-                            env={'PLAYWRIGHT_BROWSERS_PATH': playwright_cache}
-                        )
-                        deps_stdout, deps_stderr = deps_process.communicate()
-                        
-                        if deps_process.returncode == 0:
-                            logger.info(f"Браузеры Playwright успешно установлены в {playwright_cache}")
-                            return True
-                        else:
-                            logger.error(f"Ошибка установки зависимостей: {deps_stderr.decode()}")
-                            return False
-                    else:
-                        logger.error(f"Ошибка установки браузеров: {stderr.decode()}")
-                        return False
-                else:
-                    raise
+
+            logger.warning("Браузеры Playwright не установлены, выполняем установку...")
+            
+            # Используем путь к Python из виртуального окружения
+            venv_python = os.path.join(project_root, 'python_env', 
+                                        'bin' if not sys.platform.startswith('win') else 'Scripts',
+                                        'python' + ('.exe' if sys.platform.startswith('win') else ''))
+            
+            env = {'PLAYWRIGHT_BROWSERS_PATH': playwright_cache}
+
+            # Установка не блокирует event loop: ждем дочерний процесс асинхронно
+            returncode, stderr = await self._run_playwright_cli(venv_python, env, 'install', 'chromium')
+            if returncode != 0:
+                logger.error(f"Ошибка установки браузеров: {stderr.decode()}")
+                return False
+
+            # Устанавливаем системные зависимости (только после успешной установки браузера)
+            returncode, stderr = await self._run_playwright_cli(venv_python, env, 'install-deps', 'chromium')
+            if returncode != 0:
+                logger.error(f"Ошибка установки зависимостей: {stderr.decode()}")
+                return False
+
+            # Сбрасываем закэшированный отрицательный результат проверки
+            _playwright_ready.cache_clear()
+            logger.info(f"Браузеры Playwright успешно установлены в {playwright_cache}")
+            return True
+
         except Exception as e:
             logger.error(f"Ошибка при проверке браузера: {e}")
             return False
 
+    @staticmethod
+    async def _run_playwright_cli(python: str, env: Dict[str, str], *args: str) -> Tuple[int, bytes]:
+        """Запуск `python -m playwright <args>` без блокировки event loop"""
+        process = await asyncio.create_subprocess_exec(
+            python, '-m', 'playwright', *args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env=env
+        )
+        _, stderr = await process.communicate()
+        return process.returncode, stderr
+
     async def setup_browser(self) -> bool:
         """Инициализация браузера и контекста"""
         try:
@@ -132,31 +410,27 @@ class BotHandler:
                 logger.error("Браузер Playwright не установлен или не настроен")
                 return False
 
-            self.playwright = await async_playwright().start()
-            logger.debug("Playwright успешно инициализирован")
-            
-            # Запуск браузера с явным указанием размера окна
-            self.browser = await self.playwright.chromium.launch(
-                headless=ENABLE_HEADLESS,
-                args=[
-                    f'--window-size={VIEWPORT_WIDTH},{VIEWPORT_HEIGHT}',
-                    '--force-device-scale-factor=1',
-                    '--mute-audio',
-                    '--hide-scrollbars',
-                    '--window-position=0,0'
-                ]
-            )
-            logger.info(f"Chromium браузер запущен в режиме отображения с размерами: {VIEWPORT_WIDTH}x{VIEWPORT_HEIGHT}")
-    
-            # Создание контекста с эмуляцией устройства
-            self.context = await self.browser.new_context(
+            # Контекст с эмуляцией устройства в браузере из общего пула
+            # (с ENABLE_VIDEO Chromium сам пишет видео контекста вместо покадровых скриншотов)
+            video_options = self.recorder.video_context_options(VIEWPORT_WIDTH, VIEWPORT_HEIGHT) if ENABLE_VIDEO else {}
+            self.context = await BROWSER_POOL.acquire(
                 viewport={"width": VIEWPORT_WIDTH, "height": VIEWPORT_HEIGHT},
-                device_scale_factor=self.device_config['device_scale_factor'],
-                user_agent=self.device_config['user_agent']
+                device_scale_factor=self.device_config.device_scale_factor,
+                user_agent=self.device_config.user_agent,
+                **video_options
             )
+            self.browser = self.context.browser
+
+            # Инициализация WebApp выполняется в самой странице при каждой навигации
+            await self.context.add_init_script(WEBAPP_INIT_JS)
             
             # Создание страницы
             self.page = await self.context.new_page()
+            self._page_closed = False
+            self._browser_disconnected = False
+            self._last_healthcheck = 0.0
+            self.page.on('close', self._on_page_close)
+            self.browser.on('disconnected', self._on_browser_disconnected)
 
             # Установка размера viewport
             await self.page.set_viewport_size({
@@ -166,17 +440,6 @@ class BotHandler:
             
             logger.debug(f"Размеры viewport и окна браузера синхронизированы: {VIEWPORT_WIDTH}x{VIEWPORT_HEIGHT}")
             
-            # Инициализация трейсера
-            if ENABLE_TRACING:
-                self.tracer = TracerManager(self.page, self.device_config)
-            
-            # Инициализация записи
-            if ENABLE_SCREENSHOTS or ENABLE_VIDEO:
-                self.recorder = ScreenRecorder(
-                    enable_video=ENABLE_VIDEO,
-                    enable_screenshots=ENABLE_SCREENSHOTS
-                )
-            
             logger.info("Браузер успешно инициализирован")
             return True
             
@@ -184,88 +447,35 @@ class BotHandler:
             logger.error(f"Ошибка инициализации браузера: {e}")
             return False
 
-    async def _setup_webapp_event_handlers(self):
-        """Настройка обработчиков событий WebApp"""
-        await self.page.evaluate("""
-            () => new Promise((resolve) => {
-                const waitForWebApp = (retries = 0) => {
-                    const tg = window.Telegram?.WebApp;
-                    if (tg && tg.ready) {
-                        // Сначала устаналиваем обработчики событий
-                        const events = [
-                            'themeChanged',
-                            'viewportChanged',
-                            'mainButtonClicked',
-                            'backButtonClicked',
-                            'settingsButtonClicked',
-                            'invoiceClosed',
-                            'popupClosed',
-                            'qrTextReceived'
-                        ];
-                        
-                        events.forEach(event => {
-                            tg.onEvent(event, (data) => {
-                                if (window.telegramTracker) {
-                                    window.telegramTracker.logEvent({
-                                        type: 'telegram_event',  // Изменили тип для различения
-                                        event_name: event,
-                                        data: data,
-                                        timestamp: Date.now(),
-                                        source: 'telegram_webapp'
-                                    });
-                                }
-                            });
-                        });
-
-                        // Отдельно отслеживаем изменение основных параметров
-                        const trackMainButton = () => {
-                            if (tg.MainButton) {
-                                window.telegramTracker.logEvent({
-                                    type: 'telegram_state',
-                                    component: 'MainButton',
-                                    state: {
-                                        isVisible: tg.MainButton.isVisible,
-                                        text: tg.MainButton.text,
-                                        color: tg.MainButton.color,
-                                        textColor: tg.MainButton.textColor
-                                    }
-                                });
-                            }
-                        };
-
-                        // Отслеживание BackButton
-                        const trackBackButton = () => {
-                            if (tg.BackButton) {
-                                window.telegramTracker.logEvent({
-                                    type: 'telegram_state',
-                                    component: 'BackButton',
-                                    state: {
-                                        isVisible: tg.BackButton.isVisible
-                                    }
-                                });
-                            }
-                        };
-
-                        // Регистрируем дополнительные обработчики
-                        tg.onEvent('mainButtonClicked', trackMainButton);
-                        tg.onEvent('backButtonClicked', trackBackButton);
-
-                        // Теперь вызываем ready() и expand()
-                        tg.ready();
-                        tg.expand();
-                        
-                        resolve();
-                    } else if (retries < 10) {
-                        setTimeout(() => waitForWebApp(retries + 1), 100);
-                    } else {
-                        console.error('WebApp initialization timeout');
-                        resolve();
-                    }
-                };
-                
-                waitForWebApp();
-            });
-        """)
+    @property
+    def tracer(self) -> Optional[TracerManager]:
+        """Трейсер текущей страницы, создается при первом обращении (только с ENABLE_TRACING)"""
+        if self._tracer is None and ENABLE_TRACING and self.page is not None:
+            self._tracer = TracerManager(self.page, self.device_config)
+        return self._tracer
+
+    @property
+    def recorder(self) -> Optional[ScreenRecorder]:
+        """Запись экрана, создается при первом обращении (только с ENABLE_SCREENSHOTS/ENABLE_VIDEO)"""
+        if self._recorder is None and (ENABLE_SCREENSHOTS or ENABLE_VIDEO):
+            self._recorder = ScreenRecorder(
+                enable_video=ENABLE_VIDEO,
+                enable_screenshots=ENABLE_SCREENSHOTS
+            )
+        return self._recorder
+
+    @staticmethod
+    def _normalize_webapp_url(url: str, version: str = '8.0') -> str:
+        """Установка tgWebAppVersion в URL WebApp (параметр может быть во фрагменте или в query)"""
+        parts = urlsplit(url)
+        for component in ('fragment', 'query'):
+            params = dict(parse_qsl(getattr(parts, component), keep_blank_values=True))
+            current_version = params.get('tgWebAppVersion')
+            if current_version is not None and current_version != version:
+                params['tgWebAppVersion'] = version
+                parts = parts._replace(**{component: urlencode(params)})
+                logger.info(f"Версия WebApp изменена с {current_version} на {version}")
+        return urlunsplit(parts)
 
     async def navigate_to_webapp(self) -> bool:
         """Навигация к WebApp"""
@@ -274,28 +484,15 @@ class BotHandler:
         
         while retry_count <= MAX_RETRY_ATTEMPTS:
             try:
-                # Модифицируем URL для установки версии 8.0
-                webapp_url = self.webapp_url
-                if 'tgWebAppVersion=' in webapp_url:
-                    # Находим текущую версию в URL
-                    version_start = webapp_url.find('tgWebAppVersion=') + len('tgWebAppVersion=')
-                    version_end = webapp_url.find('&', version_start)
-                    current_version = webapp_url[version_start:version_end] if version_end != -1 else webapp_url[version_start:]
-                    
-                    # Если версия не 8.0, заменяем её
-                    if current_version != '8.0':
-                        webapp_url = webapp_url.replace(
-                            f'tgWebAppVersion={current_version}',
-                            'tgWebAppVersion=8.0'
-                        )
-                        logger.info(f"Версия WebApp изменена с {current_version} на 8.0")
-                
+                webapp_url = self._normalized_url
                 logger.info(f"Переход по URL (попытка {retry_count + 1}/{MAX_RETRY_ATTEMPTS + 1}): {webapp_url}")
                 
-                # Переход по URL с обновленной версией
+                # Переход по URL с обновленной версией: достаточно разобранного DOM,
+                # networkidle на WebApp с постоянными соединениями ждет десятки секунд
                 response = await self.page.goto(
                     webapp_url,
-                    wait_until='networkidle'
+                    wait_until='domcontentloaded',
+                    timeout=30000
                 )
                 
                 if not response or not response.ok:
@@ -307,77 +504,54 @@ class BotHandler:
                         continue
                     return False
 
-                # Инжектируем скрипт в head до загрузки других скриптов
-                logger.debug("Инжектирование telegram-web-app.js в head...")
-                await self.page.evaluate("""
-                    () => new Promise((resolve, reject) => {
-                        const script = document.createElement('script');
-                        script.src = 'https://telegram.org/js/telegram-web-app.js';
-                        
-                        // Добавляем обработчик для отслеживания состояния загрузки
-                        script.onload = () => {
-                            console.log('WebApp script loaded');
-                            if (window.Telegram?.WebApp) {
-                                console.log('WebApp object available');
-                                window.Telegram.WebApp.ready();
-                                window.Telegram.WebApp.expand();
-                                resolve();
-                            } else {
-                                reject(new Error('WebApp object not initialized'));
-                            }
-                        };
-                        script.onerror = () => reject(new Error('Failed to load WebApp script'));
-                        
-                        // Вставляем скрипт в начало head
-                        const head = document.getElementsByTagName('head')[0];
-                        head.insertBefore(script, head.firstChild);
-                    })
-                """)
-                logger.info("Скрипт WebApp успешно инжектирован")
-
-                # Настройка обработчиков событий WebApp
-                await self._setup_webapp_event_handlers()
-                
-                # Проверяем инициализацию и состоние WebApp
-                init_status = await self.page.evaluate("""
-                    () => {
-                        const tg = window.Telegram?.WebApp;
-                        return {
-                            initialized: !!tg,
-                            version: tg?.version,
-                            platform: tg?.platform,
-                            colorScheme: tg?.colorScheme,
-                            themeParams: tg?.themeParams,
-                            isExpanded: tg?.isExpanded,
-                            viewportHeight: tg?.viewportHeight,
-                            viewportStableHeight: tg?.viewportStableHeight
-                        };
-                    }
-                """)
-                
-                logger.info(f"Статус инициализации WebApp: {init_status}")
+                # Скрипт WebApp, обработчики событий и статус инициализации
+                # подготовлены init-скриптом контекста: забираем статус одним ожиданием
+                status_handle = await self.page.wait_for_function(
+                    INIT_STATUS_JS,
+                    timeout=15000
+                )
+                # Для работы нужен только флаг; полный статус (с themeParams) передается
+                # через CDP только при включенном DEBUG логе
+                initialized = await status_handle.evaluate(INIT_FLAG_JS)
+                logger.info(f"WebApp инициализирован: {initialized}")
+                if ENABLE_DEBUG_LOG:
+                    logger.debug(f"Статус инициализации WebApp: {await status_handle.json_value()}")
+
+                # Init-скрипт не смог загрузить SDK: повторная загрузка через add_script_tag
+                # без повторной навигации (обработчики событий трекера в этом случае не вешаются)
+                if not initialized:
+                    logger.warning("SDK WebApp не загружен init-скриптом, повторная загрузка")
+                    try:
+                        await self.page.add_script_tag(url=TELEGRAM_WEBAPP_JS_URL)
+                        await self.page.wait_for_function(
+                            WEBAPP_AVAILABLE_JS,
+                            timeout=10000
+                        )
+                        await self.page.evaluate(WEBAPP_READY_JS)
+                        initialized = True
+                        logger.info("Скрипт WebApp успешно инжектирован")
+                    except Exception as e:
+                        logger.error(f"Не удалось загрузить SDK WebApp: {e}")
 
                 # Модуль для Bombie бота который для других ботов
                 # может быть не валидным или требовать изменений
                 # Работа с Canvas объектами 
-                if init_status['initialized']:
+                if initialized:
                     try:
                         logger.info("Ожидание редиректа на игру...")
                         
-                        # Ждем редирект с таймаутом
-                        await self.page.wait_for_function(
-                            "() => window.location.href.includes('games.pluto.vision')",
-                            timeout=50000
+                        # Ждем редирект по событию навигации (без опроса страницы)
+                        await self.page.wait_for_url(
+                            GAME_URL_PATTERN,
+                            timeout=50000,
+                            wait_until='domcontentloaded'
                         )
                         logger.info(f"Редирект выполнен успешно: {self.page.url}")
                         
-                        # Ждем загрузку страницы после редиректа
-                        await self.page.wait_for_load_state('networkidle')
-                        logger.info("Страница успешно загружена")
-                        
-                        # Инициализируем обработчик canvas только после полной загрузки
-                        canvas_handler = GameCanvasHandler(self.page)
-                        if not await canvas_handler.initialize():
+                        # Обработчик canvas сам дожидается появления canvas игры
+                        await self._stop_canvas_handler()
+                        self._canvas_handler = GameCanvasHandler(self.page)
+                        if not await self._canvas_handler.initialize():
                             logger.error("Не удалось инициализировать canvas")
                             return False
                             
@@ -408,28 +582,41 @@ class BotHandler:
                     logger.error(f"Ошибка на��игации: {e}")
                     return False
 
+    async def _stop_canvas_handler(self):
+        """Остановка трекера canvas: дописывает очередь и закрывает файл"""
+        if self._canvas_handler:
+            await self._canvas_handler.cleanup()
+            self._canvas_handler = None
+
+    def _on_page_close(self, _page):
+        self._page_closed = True
+
+    def _on_browser_disconnected(self, _browser):
+        self._browser_disconnected = True
+
     async def check_connection(self) -> bool:
         """Проверка соединения и попытка переподключения"""
         try:
-            if self.page.is_closed():
+            if self._page_closed:
                 # Проверяем, был ли браузер закрыт вручную
-                if self.browser.is_connected() == False:
+                if self._browser_disconnected:
                     logger.info("Браузер был закрыт вручную")
                     return False
                 logger.warning("Страница закрыта, требуется переподключение")
                 return await self.try_reconnect()
                 
-            # Проверка доступности WebApp
-            # logger.debug("Проверка доступности WebApp...")
-            is_available = await self.page.evaluate(
-                "() => !!window.Telegram?.WebApp"
-            )
+            # Проверка доступности WebApp не чаще одного раза в HEALTHCHECK_INTERVAL
+            now = time.monotonic()
+            if now - self._last_healthcheck < HEALTHCHECK_INTERVAL:
+                return True
+
+            is_available = await self.page.evaluate(WEBAPP_AVAILABLE_JS)
             
             if not is_available:
                 logger.error("WebApp недоступен, попытка переподключения")
                 return await self.try_reconnect()
                 
-            # logger.debug("Соединение активно")
+            self._last_healthcheck = now
             return True
             
         except Exception as e:
@@ -440,6 +627,15 @@ class BotHandler:
             logger.error(f"Ошибка проверки соединения: {e}")
             return await self.try_reconnect()
 
+    async def _screenshot_loop(self):
+        """Периодические скриншоты мониторинга в очередь фоновой записи"""
+        while self.is_running:
+            if not self._page_closed:
+                if ENABLE_DEBUG_LOG:
+                    logger.debug("Создание скриншота...")
+                await self.recorder.enqueue_screenshot(self.page, "monitoring")
+            await asyncio.sleep(SCREENSHOT_INTERVAL)
+
     async def try_reconnect(self) -> bool:
         """Попытка переподключения"""
         if self.reconnect_attempts >= MAX_RECONNECT_ATTEMPTS:
@@ -455,7 +651,7 @@ class BotHandler:
         
         try:
             logger.debug("Очистка текущей сессии...")
-            await self.cleanup(full=False)
+            await self.cleanup()
             
             logger.debug("Попытка переинициализации браузера...")
             if await self.setup_browser():
@@ -474,29 +670,48 @@ class BotHandler:
             
         return False
 
-    async def cleanup(self, full: bool = True):
+    async def cleanup(self):
         """Очистка ресурсов"""
         try:
-            if self.tracer:
-                await self.tracer.stop_tracing()
-                
-            if self.context:
-                await self.context.close()
+            # Трейсер привязан к странице: при переподключении создается заново
+            if self._tracer:
+                await self._tracer.stop_tracing()
+                self._tracer = None
+
+            await self._stop_canvas_handler()
+
+            # Останавливаем периодические скриншоты и дописываем оставшиеся из очереди
+            if self._screenshot_task:
+                self._screenshot_task.cancel()
+                try:
+                    await self._screenshot_task
+                except asyncio.CancelledError:
+                    pass
+                self._screenshot_task = None
+
+            if self._recorder:
+                await self._recorder.stop_writer()
                 
+            # Браузер остается в пуле для следующего запуска или переподключения
             if self.browser:
-                await self.browser.close()
-                
-            if full and self.playwright:
-                await self.playwright.stop()
+                self.browser.remove_listener('disconnected', self._on_browser_disconnected)
+
+            if self.context:
+                await BROWSER_POOL.release(self.context)
+                self.context = None
                 
         except Exception as e:
             logger.error(f"Ошибка при очистке ресурсов: {e}")
 
     async def run(self) -> bool:
         """Основной метод работы"""
+        prewarm_task: Optional[asyncio.Task] = None
         try:
             logger.info("Запуск обработчика WebApp")
             
+            # Модели OCR грузятся в отдельном потоке параллельно с запуском браузера и навигацией
+            prewarm_task = asyncio.create_task(WebAppLogic.prewarm())
+
             # Инициализация
             logger.debug("Инициализация браузера...")
             if not await self.setup_browser():
@@ -510,15 +725,23 @@ class BotHandler:
                 logger.debug("Запуск трейсинга...")
                 await self.tracer.start_tracing()
             
-            # Навигация к WebApp
+            # Навигация к WebApp, параллельно завершается подготовка логики
             logger.debug("Навигация к WebApp...")
-            if not await self.navigate_to_webapp():
+            webapp_logic = WebAppLogic(self.page)
+            # Прогрев необязателен: его ошибка логируется, модели догрузятся при первом использовании
+            navigated, prewarm_result = await asyncio.gather(
+                self.navigate_to_webapp(), prewarm_task, return_exceptions=True
+            )
+            if isinstance(prewarm_result, BaseException):
+                logger.warning(f"Не удалось заранее подготовить логику WebApp: {prewarm_result}")
+            if isinstance(navigated, BaseException):
+                raise navigated
+            if not navigated:
                 logger.error("Не удалось выполнить навигацию к WebApp")
                 return False
 
-            # Инициализация и запуск логики WebApp
+            # Запуск логики WebApp
             logger.info("Запуск основной логики действий бота")
-            webapp_logic = WebAppLogic(self.page)
             logic_task = asyncio.create_task(webapp_logic.start_logic())
             
             # Основной цикл работы
@@ -526,22 +749,19 @@ class BotHandler:
                 try:
                     if not await self.check_connection():
                         # Проверяем, был ли браузер закрыт вручную
-                        if self.browser.is_connected() == False:
+                        if self._browser_disconnected:
                             logger.info("Браузер был закрыт вручную - успешное завершение")
                             return True
                         logger.warning("Потеряно соединение, завершение работы")
                         break
+
+                    # Скриншоты мониторинга идут со своим периодом, независимо от проверок соединения
+                    # (после переподключения задача запускается заново)
+                    if ENABLE_SCREENSHOTS and self._screenshot_task is None and self.recorder:
+                        self._screenshot_task = asyncio.create_task(self._screenshot_loop())
                     
-                    # Имитация человеческого поведения
-                    delay = await self.human.random_delay()
-                                        
-                    # Создание скриншота
-                    if self.recorder and ENABLE_SCREENSHOTS:
-                        logger.debug("Создание скриншота...")
-                        await self.recorder.take_screenshot(
-                            self.page,
-                            "monitoring"
-                        )
+                    # Имитация человеческого поведения, но не чаще MIN_LOOP_PERIOD
+                    await asyncio.sleep(max(MIN_LOOP_PERIOD, random.uniform(0.450, 1.050)))
                         
                 except Exception as e:
                     # Проверяем специфические ошибки, связанные с закрытием браузера
@@ -562,6 +782,16 @@ class BotHandler:
             return False
             
         finally:
+            # При раннем выходе (браузер не поднялся, ошибка трейсинга) прогрев еще может выполняться,
+            # а завершившийся с ошибкой результат нужно забрать
+            if prewarm_task is not None:
+                prewarm_task.cancel()
+                try:
+                    await prewarm_task
+                except asyncio.CancelledError:
+                    pass
+                except Exception as e:
+                    logger.debug(f"Прогрев логики WebApp завершился с ошибкой: {e}")
             logger.debug("Очистка ресурсов...")
             await self.cleanup()
 
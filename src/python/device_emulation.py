@@ -1,9 +1,35 @@
+"""Эмуляция Android-устройств для TelegramClient и WebApp.
+
+Таблица устройств читается из data/android_devices.json, конфигурации
+собираются один раз при импорте и отдаются вызывающим как общие
+неизменяемые экземпляры TelegramDeviceConfig.
+"""
+import hashlib
+import json
 import random
-from dataclasses import dataclass
-from typing import Dict, List, Optional
+import sys
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, NamedTuple, Optional, Tuple, TypedDict
 from loguru import logger
 
-@dataclass
+# Отдельный генератор для выбора устройства; связанный метод кэшируется на уровне модуля
+_rand_idx = random.Random().randrange
+
+# Таблица устройств хранится отдельно от кода
+_DEVICES_PATH = Path(__file__).parent / "data" / "android_devices.json"
+
+class DeviceInfo(NamedTuple):
+    """Аппаратные данные устройства"""
+    brand: str
+    model: str
+    sdk: str
+    hardware: str
+
+
+@dataclass(frozen=True, slots=True)
 class AndroidDevice:
     """Расширенный класс для хранения данных об эмулируемом Android-устройстве"""
     # Параметры для Telegram API
@@ -12,7 +38,7 @@ class AndroidDevice:
     app_version: str
     lang_code: str
     system_lang_code: str
-    device_info: Dict[str, str]
+    device_info: DeviceInfo
     
     # WebView специфичные параметры
     user_agent: str
@@ -26,100 +52,81 @@ class AndroidDevice:
     tg_webapp_version: str
     tg_webapp_start_param: str
 
+    # 128-битный отпечаток user_agent, считается один раз при создании
+    ua_hash: bytes = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "ua_hash", hashlib.sha256(self.user_agent.encode()).digest()[:16])
+
+
+def _intern_strings(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Интернирует строковые значения: одинаковые строки разных устройств делят один объект"""
+    return {key: sys.intern(value) if isinstance(value, str) else value for key, value in record.items()}
+
+
+@lru_cache(maxsize=1)
+def _load_devices() -> Tuple[AndroidDevice, ...]:
+    """Загружает таблицу устройств из data/android_devices.json"""
+    devices = []
+    for record in json.loads(_DEVICES_PATH.read_bytes()):
+        record = _intern_strings(record)
+        record["device_info"] = DeviceInfo(**_intern_strings(record["device_info"]))
+        devices.append(AndroidDevice(**record))
+    return tuple(devices)
+
+
+# Выбранное устройство хранится отдельно для каждой asyncio-задачи
+_SELECTED_DEVICE: ContextVar[Optional[AndroidDevice]] = ContextVar("selected_device", default=None)
+
+
+def get_selected_device() -> Optional[AndroidDevice]:
+    """Возвращает устройство, выбранное в текущем контексте"""
+    return _SELECTED_DEVICE.get()
+
 
 class AndroidDeviceEmulator:
     """Расширенный эмулятор Android-устройств с WebView параметрами"""
     def __init__(self):
-        self.devices = [
-            AndroidDevice(
-                # Telegram API параметры
-                device_model="Pixel 7 Pro",
-                system_version="Android 14",
-                app_version="10.6.1",
-                lang_code="ru",
-                system_lang_code="ru-RU",
-                device_info={
-                    "brand": "Google",
-                    "model": "GP4BC",
-                    "sdk": "34",
-                    "hardware": "tensor"
-                },
-                # WebView параметры реального Pixel 7 Pro
-                user_agent="Mozilla/5.0 (Linux; Android 14; Pixel 7 Pro) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Mobile Safari/537.36",
-                viewport_width=412,
-                viewport_height=915,
-                device_scale_factor=3.5,
-                
-                # Telegram WebApp параметры
-                tg_webapp_platform="android",
-                tg_webapp_theme="light",
-                tg_webapp_version="7.10",
-                tg_webapp_start_param=""
-            ),
-            AndroidDevice(
-                # Telegram API параметры
-                device_model="Galaxy S23 Ultra",
-                system_version="Android 14",
-                app_version="10.5.0",
-                lang_code="ru",
-                system_lang_code="ru-RU",
-                device_info={
-                    "brand": "samsung",
-                    "model": "SM-S918B",
-                    "sdk": "34",
-                    "hardware": "qcom"
-                },
-                # WebView параметры реального S23 Ultra
-                user_agent="Mozilla/5.0 (Linux; Android 14; SM-S918B) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Mobile Safari/537.36",
-                viewport_width=384,
-                viewport_height=854,
-                device_scale_factor=3.75,
-                
-                # Telegram WebApp параметры
-                tg_webapp_platform="android",
-                tg_webapp_theme="light",
-                tg_webapp_version="7.10",
-                tg_webapp_start_param=""
-            ),
-            AndroidDevice(
-                # Telegram API параметры
-                device_model="OnePlus 11",
-                system_version="Android 14",
-                app_version="10.4.2",
-                lang_code="ru",
-                system_lang_code="ru-RU",
-                device_info={
-                    "brand": "OnePlus",
-                    "model": "CPH2449",
-                    "sdk": "34",
-                    "hardware": "qcom"
-                },
-                # WebView параметры реального OnePlus 11
-                user_agent="Mozilla/5.0 (Linux; Android 14; CPH2449) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0.0.0 Mobile Safari/537.36",
-                viewport_width=412,
-                viewport_height=919,
-                device_scale_factor=3.0,
-                
-                # Telegram WebApp параметры
-                tg_webapp_platform="android",
-                tg_webapp_theme="light",
-                tg_webapp_version="7.10",
-                tg_webapp_start_param=""
-            )
-        ]
-        self.selected_device = None
+        self.devices: Tuple[AndroidDevice, ...] = _load_devices()
+        self._by_model: Dict[str, AndroidDevice] = {device.device_model: device for device in self.devices}
 
     def get_random_device(self) -> AndroidDevice:
-        """Возвращает случайное устройство и сохраняет его для последующего использования"""
-        self.selected_device = random.choice(self.devices)
-        logger.info(f"Выбрано устройство: {self.selected_device.device_model}")
-        return self.selected_device
-
-def get_telegram_device_config() -> Dict[str, str]:
-    """Возвращает конфигурацию для TelegramClient через эмулятор"""
-    emulator = AndroidDeviceEmulator()
-    device = emulator.get_random_device()
-    
+        """Возвращает случайное устройство и запоминает его в контексте текущей задачи"""
+        device = self.devices[_rand_idx(len(self.devices))]
+        _SELECTED_DEVICE.set(device)
+        logger.opt(lazy=True).info("Выбрано устройство: {}", lambda: device.device_model)
+        return device
+
+    def get_device_by_model(self, name: str) -> AndroidDevice:
+        """Возвращает устройство по device_model (KeyError, если такого нет)"""
+        return self._by_model[name]
+
+class ViewportDict(TypedDict):
+    width: int
+    height: int
+
+
+class WebAppDict(TypedDict):
+    platform: str
+    theme: str
+    start_param: str
+
+
+class DeviceConfigDict(TypedDict):
+    """Форма JSON-конфигурации, которую отдаёт get_telegram_device_config_json"""
+    device_model: str
+    system_version: str
+    app_version: str
+    lang_code: str
+    system_lang_code: str
+    user_agent: str
+    viewport: ViewportDict
+    device_scale_factor: float
+    telegram_webapp: WebAppDict
+
+
+def _build_config(device: AndroidDevice) -> DeviceConfigDict:
+    """Собирает словарь конфигурации устройства для сериализации в JSON"""
     return {
         # Параметры для TelegramClient
         "device_model": device.device_model,
@@ -142,4 +149,85 @@ def get_telegram_device_config() -> Dict[str, str]:
             "theme": device.tg_webapp_theme,
             "start_param": device.tg_webapp_start_param
         }
-    }
\ No newline at end of file
+    }
+
+@dataclass(frozen=True, slots=True)
+class TelegramDeviceConfig:
+    """Неизменяемая конфигурация TelegramClient/WebApp, общая для всех вызывающих"""
+    # Параметры для TelegramClient
+    device_model: str
+    system_version: str
+    app_version: str
+    lang_code: str
+    system_lang_code: str
+    user_agent: str
+
+    # Параметры для WebApp
+    viewport_width: int
+    viewport_height: int
+    device_scale_factor: float
+
+    # Параметры Telegram WebApp
+    webapp_platform: str
+    webapp_theme: str
+    webapp_start_param: str
+
+    @classmethod
+    def from_device(cls, device: AndroidDevice) -> "TelegramDeviceConfig":
+        return cls(
+            device_model=device.device_model,
+            system_version=device.system_version,
+            app_version=device.app_version,
+            lang_code=device.lang_code,
+            system_lang_code=device.system_lang_code,
+            user_agent=device.user_agent,
+            viewport_width=device.viewport_width,
+            viewport_height=device.viewport_height,
+            device_scale_factor=device.device_scale_factor,
+            webapp_platform=device.tg_webapp_platform,
+            webapp_theme=device.tg_webapp_theme,
+            webapp_start_param=device.tg_webapp_start_param,
+        )
+
+@lru_cache(maxsize=1)
+def _get_emulator() -> AndroidDeviceEmulator:
+    """Единственный экземпляр эмулятора на процесс"""
+    return AndroidDeviceEmulator()
+
+class _DeviceTable(NamedTuple):
+    """Таблица устройств по столбцам: выбор читает только нужные столбцы по индексу"""
+    devices: Tuple[AndroidDevice, ...]
+    device_models: Tuple[str, ...]
+    configs: Tuple[TelegramDeviceConfig, ...]
+    configs_json: Tuple[bytes, ...]
+
+
+def _build_table(devices: Tuple[AndroidDevice, ...]) -> _DeviceTable:
+    """Собирает столбцы готовых конфигураций и их JSON"""
+    return _DeviceTable(
+        devices=devices,
+        device_models=tuple(device.device_model for device in devices),
+        configs=tuple(TelegramDeviceConfig.from_device(device) for device in devices),
+        configs_json=tuple(
+            json.dumps(_build_config(device), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            for device in devices
+        ),
+    )
+
+# Конфигурации устройств и их JSON собираются один раз при импорте
+_TABLE = _build_table(_get_emulator().devices)
+
+def _pick_device_index() -> int:
+    """Выбирает случайное устройство и возвращает его индекс в таблице"""
+    i = _rand_idx(len(_TABLE.devices))
+    _SELECTED_DEVICE.set(_TABLE.devices[i])
+    logger.opt(lazy=True).info("Выбрано устройство: {}", lambda: _TABLE.device_models[i])
+    return i
+
+def get_telegram_device_config() -> TelegramDeviceConfig:
+    """Возвращает общую неизменяемую конфигурацию для TelegramClient через эмулятор"""
+    return _TABLE.configs[_pick_device_index()]
+
+def get_telegram_device_config_json() -> bytes:
+    """Возвращает заранее сериализованную в JSON конфигурацию случайного устройства"""
+    return _TABLE.configs_json[_pick_device_index()]
@@ -1,29 +1,80 @@
 import os
-import sys
+import re
 import asyncio
+import functools
 from pathlib import Path
-from typing import Optional, Tuple, Union, List, Dict, Any
+from typing import Any, Awaitable, Dict, Iterable, List, Optional, Tuple, Union
 from telethon import TelegramClient, events, functions
 from telethon.tl.types import Message
-from telethon.errors import SessionPasswordNeededError, AuthKeyUnregisteredError
+from telethon.sessions import SQLiteSession
+from telethon.errors import SessionPasswordNeededError, AuthKeyUnregisteredError, UsernameInvalidError, UsernameNotOccupiedError
+from telethon.tl.functions.contacts import ResolveUsernameRequest
 from telethon.tl.custom.button import Button
+from telethon.utils import get_display_name
 from loguru import logger
+from device_emulation import TelegramDeviceConfig, get_telegram_device_config
 from dotenv import load_dotenv
 import getpass
 import signal
 from datetime import datetime
+from enum import Enum, auto
 import json
 import time
 
+# URL в тексте сообщения: всё до пробела, кавычки, угловой или закрывающей скобки
+_URL_RE = re.compile(r'https?://[^\s<>"\'\)]+')
+
+# Таймаут сетевых запросов к Telegram, секунды
+_NET_TIMEOUT = 15.0
+
+def _log_errors(message: str, default: Any = None):
+    """Декоратор: логирует исключение метода и возвращает default (вызывается, если это фабрика)"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                logger.error(f"{message}: {e}")
+                return default() if callable(default) else default
+        return wrapper
+    return decorator
+
+class AuthResult(Enum):
+    """Итог попытки входа"""
+    SUCCESS = auto()
+    NEEDS_RESET = auto()  # 2FA не пройдена: сессию нужно удалить и войти заново
+    FAIL = auto()
+
 class TelegramLogin:
+    # Верхняя граница обхода диалогов при поиске бота по имени
+    MAX_DIALOG_SCAN = 500
+    # Сколько ждать ответа бота после отправки сообщения или нажатия кнопки
+    BOT_REPLY_TIMEOUT = 5.0
+    # Сколько раз можно начать вход заново с чистой сессией после неудачной 2FA
+    MAX_SESSION_RESETS = 2
+    # Предел одновременных подключений в connect_many
+    MAX_CONCURRENT_CONNECTS = 8
+    # Интерактивный вход (ввод кода и пароля 2FA) общий для всех аккаунтов процесса:
+    # запросы для разных номеров не должны перемешиваться в одном stdin
+    _interactive_lock = asyncio.Lock()
+
     def __init__(self, api_id: int, api_hash: str, phone: str):
         self.api_id = api_id
         self.api_hash = api_hash
         self.phone = phone
         self.session_dir = Path(".py_session")
         self.session_file = self.session_dir / f"{phone.replace('+', '')}.session"
+        # Наличие файла сессии отслеживается флагом, без stat() на каждом пути сброса
+        self._session_present = self.session_file.exists()
         self.client: Optional[TelegramClient] = None
-        self.device_config = None
+        self.device_config: Optional[TelegramDeviceConfig] = None
+        # Открытая SQLite-сессия переиспользуется между пересозданиями клиента
+        self._session: Optional[SQLiteSession] = None
+        # Профиль пользователя не меняется в рамках сессии, запрашивается один раз
+        self._me = None
+        # Целевой текст кнопки запуска читается и приводится к нижнему регистру один раз
+        self._launch_target_lower = (os.getenv("TELEGRAM_LAUNCH_BUTTON_TEXT") or "").strip().lower()
 
     async def ensure_session_directory(self):
         """Создание директории для сессий"""
@@ -32,85 +83,126 @@ class TelegramLogin:
 
     async def initialize_client(self) -> TelegramClient:
         """Инициализация клиента Telegram"""
-        from device_emulation import get_telegram_device_config 
-               
-        self.device_config = get_telegram_device_config()
+        # Устройство выбирается один раз: повторные клиенты этого входа представляются тем же устройством
+        if self.device_config is None:
+            self.device_config = get_telegram_device_config()
+        
+        if self._session is None:
+            self._session = SQLiteSession(str(self.session_file))
+            self._session_present = True
         
         client = TelegramClient(
-            str(self.session_file),
+            self._session,
             self.api_id,
             self.api_hash,
-            device_model=self.device_config["device_model"],
-            system_version=self.device_config["system_version"],
-            app_version=self.device_config["app_version"],
-            lang_code=self.device_config["lang_code"]
+            device_model=self.device_config.device_model,
+            system_version=self.device_config.system_version,
+            app_version=self.device_config.app_version,
+            lang_code=self.device_config.lang_code
         )
         
-        logger.info(f"Инициализация клиента с устройством: {self.device_config['device_model']}")
+        logger.info(f"Инициализация клиента с устройством: {self.device_config.device_model}")
         return client
 
-    async def handle_2fa(self, client: TelegramClient) -> bool:
+    def _drop_session(self):
+        """Удаляет файл сессии вместе с закэшированным SQLiteSession"""
+        self._session = None
+        self._remove_session_file()
+
+    def _remove_session_file(self):
+        """Удаляет файл сессии, если он был создан"""
+        if self._session_present:
+            self.session_file.unlink(missing_ok=True)
+            self._session_present = False
+
+    @staticmethod
+    async def _async_getpass(prompt: str) -> str:
+        """Ввод секрета в отдельном потоке, чтобы не блокировать event loop Telethon"""
+        return await asyncio.get_running_loop().run_in_executor(None, getpass.getpass, prompt)
+
+    async def handle_2fa(self, client: TelegramClient) -> AuthResult:
         """Обработка двухфакторной аутентификации"""
         try:
             logger.info("Требуется 2FA")
             for _ in range(3):  # Даем 3 попытки ввода 2FA
                 try:
-                    password = getpass.getpass("Введите пароль 2FA: ")
-                    await client.sign_in(password=password)
+                    password = await self._async_getpass("Введите пароль 2FA: ")
+                    await asyncio.wait_for(client.sign_in(password=password), _NET_TIMEOUT)
                     logger.info("2FA авторизация успешна")
-                    return True
+                    return AuthResult.SUCCESS
                 except Exception as e:
                     logger.error(f"Ошибка 2FA: {e}")
                     continue  # Продолжаем попытки ввода 2FA
             
-            # Если все попытки 2FA неудачны, очищаем сессию и начинаем заново
-            logger.warning("Все попытки 2FA неудачны, очищаем сессию")
-            await client.disconnect()
-            if self.session_file.exists():
-                self.session_file.unlink()
-            
-            # Создаем новый клиент и начинаем процесс входа заново
-            self.client = await self.initialize_client()
-            await self.client.connect()
-            return await self.sign_in(self.client)
+            # Если все попытки 2FA неудачны, сессию нужно очистить и начать заново
+            return AuthResult.NEEDS_RESET
             
         except Exception as e:
             logger.error(f"Критическая ошибка 2FA: {e}")
             # В случае критической ошибки также очищаем сессию
-            await client.disconnect()
-            if self.session_file.exists():
-                self.session_file.unlink()
-            return False
+            await asyncio.wait_for(client.disconnect(), _NET_TIMEOUT)
+            self._drop_session()
+            return AuthResult.FAIL
+
+    async def sign_in(self, client: TelegramClient, known_unauthorized: bool = False) -> bool:
+        """
+        Процесс входа в аккаунт; после неудачной 2FA повторяется с чистой сессией.
+        known_unauthorized - вызывающий код уже проверил авторизацию, повторный запрос не нужен
+        """
+        for _ in range(self.MAX_SESSION_RESETS + 1):
+            result = await self._sign_in_once(client, check_authorized=not known_unauthorized)
+            if result is AuthResult.SUCCESS:
+                self._session_present = True
+                return True
+            if result is AuthResult.FAIL:
+                return False
+
+            logger.warning("Все попытки 2FA неудачны, очищаем сессию")
+            try:
+                await asyncio.wait_for(client.disconnect(), _NET_TIMEOUT)
+                self._drop_session()
+                # Старый клиент отпускаем сразу, чтобы не держать его до конца входа
+                client = None
+                self.client = client = await self.initialize_client()
+                await asyncio.wait_for(client.connect(), _NET_TIMEOUT)
+                # Сессия только что удалена, клиент заведомо не авторизован
+                known_unauthorized = True
+            except Exception as e:
+                logger.error(f"Ошибка пересоздания сессии: {e}")
+                return False
+
+        logger.error("Превышено число попыток входа")
+        return False
 
-    async def sign_in(self, client: TelegramClient) -> bool:
-        """Процесс входа в аккаунт"""
+    async def _sign_in_once(self, client: TelegramClient, check_authorized: bool = True) -> AuthResult:
+        """Одна попытка входа: запрос кода, ввод кода и при необходимости 2FA"""
         try:
-            if not await client.is_user_authorized():
+            if not check_authorized or not await asyncio.wait_for(client.is_user_authorized(), _NET_TIMEOUT):
                 logger.info("Начинаем процесс входа...")
                 
                 # Запрашиваем код
-                phone = await client.send_code_request(self.phone)
+                phone = await asyncio.wait_for(client.send_code_request(self.phone), _NET_TIMEOUT)
                 
                 # Ждем ввод кода
                 for attempt in range(3):
                     try:
-                        code = getpass.getpass(f"Введите код подтверждения (попытка {attempt + 1}/3): ")
-                        await client.sign_in(self.phone, code, phone_code_hash=phone.phone_code_hash)
+                        code = await self._async_getpass(f"Введите код подтверждения (попытка {attempt + 1}/3): ")
+                        await asyncio.wait_for(client.sign_in(self.phone, code, phone_code_hash=phone.phone_code_hash), _NET_TIMEOUT)
                         logger.info("Успешный вход в аккаунт")
-                        return True
+                        return AuthResult.SUCCESS
                     except SessionPasswordNeededError:
                         return await self.handle_2fa(client)
                     except Exception as e:
                         logger.error(f"Ошибка входа: {e}")
                         if attempt == 2:
-                            return False
+                            return AuthResult.FAIL
             else:
                 logger.info("Уже авторизован")
-                return True
+                return AuthResult.SUCCESS
                 
         except Exception as e:
             logger.error(f"Критическая ошибка входа: {e}")
-            return False
+            return AuthResult.FAIL
 
     async def find_bot_url(self, client: TelegramClient) -> Tuple[Optional[str], Dict[str, Any]]:
         """Поиск URL бота с учетом приоритетов"""
@@ -119,12 +211,28 @@ class TelegramLogin:
             found_url = None
             bot_metadata = None
 
-            # Ищем бота в диалогах
-            async for dialog in client.iter_dialogs():
-                if dialog.name == bot_name:
-                    logger.info(f"Найден бот: {bot_name}")
-                    found_url, bot_metadata = await self.process_bot_chat(client, dialog)
-                    break
+            # Ищем бота напрямую по имени (кэш сущностей сессии), без обхода всех диалогов
+            bot_entity = None
+            if bot_name:
+                try:
+                    bot_entity = await asyncio.wait_for(client.get_entity(bot_name), _NET_TIMEOUT)
+                except Exception as e:
+                    logger.debug(f"get_entity не нашел {bot_name}: {e}")
+                # get_entity принимает и username, и телефон: берем результат, только если
+                # это бот с тем же отображаемым именем, что и диалог при обходе
+                if bot_entity is not None and not (getattr(bot_entity, 'bot', False)
+                                                   and get_display_name(bot_entity) == bot_name):
+                    bot_entity = None
+                if bot_entity is None:
+                    # Ищем среди неархивных диалогов
+                    try:
+                        bot_entity = await asyncio.wait_for(self._scan_dialogs_for(client, bot_name), _NET_TIMEOUT)
+                    except Exception as e:
+                        logger.warning(f"Ошибка поиска {bot_name} в диалогах: {e}")
+
+            if bot_entity is not None:
+                logger.info(f"Найден бот: {bot_name}")
+                found_url, bot_metadata = await self.process_bot_chat(client, bot_entity)
             
             # Если бот не найден в диалогах, пробуем найти по username
             if not found_url:
@@ -135,19 +243,20 @@ class TelegramLogin:
                     logger.info(f"Пытаемся найти бота по username: {bot_username}")
                     
                     try:
-                        bot_entity = await client.get_entity(bot_username)
+                        # Один запрос contacts.resolveUsername вместо многошаговой логики get_entity
+                        resolved = await asyncio.wait_for(client(ResolveUsernameRequest(username=bot_username)), _NET_TIMEOUT)
+                        if not resolved.users:
+                            raise ValueError(f"{bot_username} не является пользователем/ботом")
+                        bot_entity = resolved.users[0]
                         logger.info(f"Бот найден: {bot_entity.username}")
                         
                         logger.info("Отправляем команду /start")
-                        await client.send_message(bot_entity, "/start")
-                        await asyncio.sleep(2)
+                        await self._await_bot_reply(client, bot_entity, client.send_message(bot_entity, "/start"))
                         
-                        # Получаем диалог с ботом
-                        async for dialog in client.iter_dialogs():
-                            if dialog.entity.id == bot_entity.id:
-                                logger.info("Обрабатываем новый диалог с ботом")
-                                found_url, bot_metadata = await self.process_bot_chat(client, dialog)
-                                break
+                        logger.info("Обрабатываем новый диалог с ботом")
+                        found_url, bot_metadata = await self.process_bot_chat(client, bot_entity)
+                    except (UsernameInvalidError, UsernameNotOccupiedError) as e:
+                        logger.error(f"Бот {bot_username} не найден: {e}")
                     except Exception as e:
                         logger.error(f"Ошибка при инициализации бота: {e}")
 
@@ -161,323 +270,352 @@ class TelegramLogin:
                 logger.info(f"Используем найденный URL: {found_url}")
                 return found_url, bot_metadata
             else:
-                error_msg = f"Бот {bot_name} не найден в диалогах и нет доступных URL"
-                logger.error(error_msg)
-                sys.exit(f"КРИТИЧЕСКАЯ ОШИБКА: {error_msg}")
+                logger.error(f"Бот {bot_name} не найден в диалогах и нет доступных URL")
+                return None, {}
 
         except Exception as e:
-            error_msg = f"Ошибка поиска URL: {e}"
-            logger.error(error_msg)
-            sys.exit(f"КРИТИЧЕСКАЯ ОШИБКА: {error_msg}")
+            # Не завершаем процесс: при параллельном входе это остановило бы остальные аккаунты
+            logger.error(f"Ошибка поиска URL: {e}")
+            return None, {}
 
+    async def _scan_dialogs_for(self, client: TelegramClient, name: str):
+        """Ищет сущность по имени диалога, не дальше MAX_DIALOG_SCAN неархивных диалогов"""
+        scanned = 0
+        async for dialog in client.iter_dialogs(archived=False, ignore_migrated=True):
+            if dialog.name == name:
+                return dialog.entity
+            scanned += 1
+            if scanned >= self.MAX_DIALOG_SCAN:
+                logger.warning(f"Бот {name} не найден среди первых {scanned} диалогов")
+                break
+        return None
+
+    async def _await_bot_reply(self, client: TelegramClient, peer, action: Awaitable) -> bool:
+        """Выполняет действие и ждёт первого нового или отредактированного сообщения бота.
+
+        Возвращает False, если бот не ответил за BOT_REPLY_TIMEOUT секунд.
+        """
+        replied = asyncio.Event()
+
+        async def on_reply(event):
+            replied.set()
+
+        reply_events = (
+            events.NewMessage(chats=peer, incoming=True),
+            events.MessageEdited(chats=peer, incoming=True),
+        )
+        for event_builder in reply_events:
+            client.add_event_handler(on_reply, event_builder)
+        try:
+            await asyncio.wait_for(action, _NET_TIMEOUT)
+            try:
+                await asyncio.wait_for(replied.wait(), self.BOT_REPLY_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning(f"Бот не ответил за {self.BOT_REPLY_TIMEOUT} с")
+                return False
+            return True
+        finally:
+            for event_builder in reply_events:
+                client.remove_event_handler(on_reply, event_builder)
+
+    @_log_errors("Ошибка получения метаданных бота", default=dict)
     async def get_bot_metadata(self, entity) -> Dict[str, Any]:
         """Получение метаданных бота"""
-        try:
-            return {
-                'bot_id': entity.id,
-                'access_hash': entity.access_hash,
-                'username': entity.username,
-                'bot_info_version': getattr(entity, 'bot_info_version', None)
-            }
-        except Exception as e:
-            logger.error(f"Ошибка получения метаданных бота: {e}")
-            return {}
-
+        return {
+            'bot_id': entity.id,
+            'access_hash': entity.access_hash,
+            'username': entity.username,
+            'bot_info_version': getattr(entity, 'bot_info_version', None)
+        }
+
+    @_log_errors("Ошибка подготовки данных WebApp", default=dict)
     async def prepare_webapp_data(self, client: TelegramClient, bot_metadata: Dict[str, Any]) -> Dict[str, Any]:
         """Подготовка данных для инициализации WebApp"""
-        try:
-            user = await client.get_me()
-            return {
-                'user': {
-                    'id': user.id,
-                    'first_name': user.first_name,
-                    'last_name': user.last_name,
-                    'username': user.username,
-                    'language_code': self.device_config.get('lang_code', 'ru')
-                },
-                'auth_date': int(time.time()),
-                'bot': bot_metadata,
-                'platform': self.device_config.get('telegram_webapp', {}).get('platform', 'desktop'),
-                'theme_params': self.device_config.get('telegram_webapp', {}).get('theme', {})
-            }
-        except Exception as e:
-            logger.error(f"Ошибка подготовки данных WebApp: {e}")
-            return {}
-
-    async def process_bot_chat(self, client: TelegramClient, dialog) -> Tuple[Optional[str], Dict[str, Any]]:
-        """Обработка чата бота для поиска URL и получения метаданных"""
-        try:
-            bot_entity = await client.get_entity(dialog.entity)
-            metadata = await self.get_bot_metadata(bot_entity)
-            url = await self._find_bot_url_internal(client, dialog)
-            logger.debug(f"Найден URL бота: {url}, метаданные бота: {metadata}, диалог: {dialog}")
-            return url, metadata
-        except Exception as e:
-            logger.error(f"Ошибка обработки чата бота: {e}")
-            return None, {}
-
-    async def _find_bot_url_internal(self, client: TelegramClient, dialog) -> Optional[str]:
+        if self._me is None:
+            self._me = await asyncio.wait_for(client.get_me(), _NET_TIMEOUT)
+        user = self._me
+        return {
+            'user': {
+                'id': user.id,
+                'first_name': user.first_name,
+                'last_name': user.last_name,
+                'username': user.username,
+                'language_code': self.device_config.lang_code
+            },
+            'auth_date': int(time.time()),
+            'bot': bot_metadata,
+            'platform': self.device_config.webapp_platform,
+            'theme_params': self.device_config.webapp_theme
+        }
+
+    @_log_errors("Ошибка обработки чата бота", default=lambda: (None, {}))
+    async def process_bot_chat(self, client: TelegramClient, peer) -> Tuple[Optional[str], Dict[str, Any]]:
+        """Обработка чата бота для поиска URL и получения метаданных (peer — сущность бота)"""
+        # peer уже разрешённая сущность бота, повторный get_entity не нужен
+        metadata = await self.get_bot_metadata(peer)
+        url = await self._find_bot_url_internal(client, peer)
+        logger.debug(f"Найден URL бота: {url}, метаданные бота: {metadata}, чат: {peer}")
+        return url, metadata
+
+    @_log_errors("Ошибка обработки чата бота")
+    async def _find_bot_url_internal(self, client: TelegramClient, peer) -> Optional[str]:
         """Внутренний метод для поиска URL бота"""
-        try:
-            # Проверяем наличие сообщений
-            messages_count = 0
-            async for _ in client.iter_messages(dialog, limit=1):
-                messages_count += 1
-
-            # 1. Поиск URL в текущих сообщениях
-            if messages_count > 0:
-                logger.info("Найдены существующие сообщения, ищем URL...")
-                url_or_button = await self.find_button_in_messages(client, dialog)
-                found_button = None  # Сохраняем найденную обычную кнопку
-                
-                if isinstance(url_or_button, str):  # Прямая ссылка
-                    logger.info(f"Найдена прмая ссылка: {url_or_button}")
-                    if self._check_button_text(url_or_button, os.getenv("TELEGRAM_LAUNCH_BUTTON_TEXT")):
-                        return url_or_button
-                    else:
-                        logger.info("Найденная ссылка не содержит целевой текст, продолжаем поиск")
-                elif url_or_button:  # Кнопка или сообщение
-                    logger.info("Найдена кнопка или сообщение, обрабатываем...")
-                    try:
-                        launch_button_text = os.getenv("TELEGRAM_LAUNCH_BUTTON_TEXT")
-                        
-                        # Сохраняем обычную кнопку, если она найдена
-                        if hasattr(url_or_button, 'text') and not hasattr(url_or_button, 'url'):
-                            found_button = url_or_button
-                        
-                        # Проверяем тип кнопки
-                        if hasattr(url_or_button, 'callback_data'):  # Inline кнопка
-                            logger.info("Обрабатываем inline кнопку")
-                            await url_or_button.click()
-                            await asyncio.sleep(2)
-                            async for message in client.iter_messages(dialog, limit=1):
-                                if url := await self.extract_url_from_message(message):
-                                    if self._check_button_text(url, launch_button_text):
-                                        return url
-                                    
-                        # Проверяем обычную копку клавиатуры
-                        elif hasattr(url_or_button, 'text') and hasattr(url_or_button, 'button'):  
-                            button_text = url_or_button.text
-                            if launch_button_text.lower() in button_text.lower():
-                                logger.info(f"Отправляем текст клавиатурной кнопки: {button_text}")
-                                await client.send_message(dialog, button_text)
-                                await asyncio.sleep(2)
-                                async for message in client.iter_messages(dialog, limit=1):
-                                    if url := await self.extract_url_from_message(message):
-                                        if self._check_button_text(url, launch_button_text):
-                                            logger.info(f"Получена подходящая ссылка: {url}")
-                                            return url
-                                        else:
-                                            logger.info("Полученная ссылка не содержит целевой текст, продолжаем поиск")
-                        # Обрабатываем текстовое сообщение
-                        elif hasattr(url_or_button, 'text'):
-                            message_text = url_or_button.text
-                            if launch_button_text.lower() in message_text.lower():
-                                logger.info(f"Найден целевой текст в сообщении, ищем URL")
-                                if url := await self.extract_url_from_message(url_or_button):
-                                    logger.info(f"Найдена ссылка в сообщении: {url}")
-                                    return url
-                                else:
-                                    logger.info("URL в сообщении не найден, продолжаем поиск")
-                        else:
-                            logger.warning("Найденный элемент не является кнопкой или сообщением")
-                        
-                        # Если ни одна проверка не дала результата и у нас есть сохраненная обычная кнопка
-                        if found_button and hasattr(found_button, 'text'):
-                            button_text = found_button.text
-                            logger.info(f"Пробуем отправить текст обычной кнопки как последний вариант: {button_text}")
-                            await client.send_message(dialog, button_text)
-                            await asyncio.sleep(2)
-                            async for message in client.iter_messages(dialog, limit=1):
-                                if url := await self.extract_url_from_message(message):
+        # Последние сообщения забираем одним запросом и переиспользуем для поиска
+        messages = await asyncio.wait_for(client.get_messages(peer, limit=20), _NET_TIMEOUT)
+
+        # 1. Поиск URL в текущих сообщениях
+        if messages:
+            logger.info("Найдены существующие сообщения, ищем URL...")
+            url_or_button = await self.find_button_in_messages(client, peer, messages)
+            found_button = None  # Сохраняем найденную обычную кнопку
+            
+            if isinstance(url_or_button, str):  # Прямая ссылка
+                logger.info(f"Найдена прмая ссылка: {url_or_button}")
+                if self._check_button_text(url_or_button):
+                    return url_or_button
+                else:
+                    logger.info("Найденная ссылка не содержит целевой текст, продолжаем поиск")
+            elif url_or_button:  # Кнопка или сообщение
+                logger.info("Найдена кнопка или сообщение, обрабатываем...")
+                try:
+                    # Атрибуты элемента читаются один раз
+                    item_text = getattr(url_or_button, 'text', None)
+                    item_url = getattr(url_or_button, 'url', None)
+                    callback_data = getattr(url_or_button, 'callback_data', None)
+                    keyboard_button = getattr(url_or_button, 'button', None)
+
+                    # Сохраняем обычную кнопку, если она найдена
+                    if item_text is not None and item_url is None:
+                        found_button = url_or_button
+                    
+                    # Проверяем тип кнопки
+                    if callback_data is not None:  # Inline кнопка
+                        logger.info("Обрабатываем inline кнопку")
+                        await self._await_bot_reply(client, peer, url_or_button.click())
+                        for message in await asyncio.wait_for(client.get_messages(peer, limit=1), _NET_TIMEOUT):
+                            if url := await self.extract_url_from_message(message):
+                                if self._check_button_text(url):
                                     return url
                                 
-                    except Exception as e:
-                        logger.error(f"Ошибка при обработке кнопк/сообщения: {e}")
+                    # Проверяем обычную копку клавиатуры
+                    elif item_text is not None and keyboard_button is not None:
+                        button_text = item_text
+                        if self._check_button_text(button_text):
+                            logger.info(f"Отправляем текст клавиатурной кнопки: {button_text}")
+                            await self._await_bot_reply(client, peer, client.send_message(peer, button_text))
+                            for message in await asyncio.wait_for(client.get_messages(peer, limit=1), _NET_TIMEOUT):
+                                if url := await self.extract_url_from_message(message):
+                                    if self._check_button_text(url):
+                                        logger.info(f"Получена подходящая ссылка: {url}")
+                                        return url
+                                    else:
+                                        logger.info("Полученная ссылка не содержит целевой текст, продолжаем поиск")
+                    # Обрабатываем текстовое сообщение
+                    elif item_text is not None:
+                        message_text = item_text
+                        if self._check_button_text(message_text):
+                            logger.info(f"Найден целевой текст в сообщении, ищем URL")
+                            if url := await self.extract_url_from_message(url_or_button):
+                                logger.info(f"Найдена ссылка в сообщении: {url}")
+                                return url
+                            else:
+                                logger.info("URL в сообщении не найден, продолжаем поиск")
+                    else:
+                        logger.warning("Найденный элемент не является кнопкой или сообщением")
+                    
+                    # Если ни одна проверка не дала результата и у нас есть сохраненная обычная кнопка
+                    if found_button:
+                        button_text = item_text
+                        logger.info(f"Пробуем отправить текст обычной кнопки как последний вариант: {button_text}")
+                        await self._await_bot_reply(client, peer, client.send_message(peer, button_text))
+                        for message in await asyncio.wait_for(client.get_messages(peer, limit=1), _NET_TIMEOUT):
+                            if url := await self.extract_url_from_message(message):
+                                return url
+                            
+                except Exception as e:
+                    logger.error(f"Ошибка при обработке кнопк/сообщения: {e}")
 
-            # Если URL не найден, пробуем отправить /start
-            logger.info("URL не найден, отправляем /start")
-            await client.send_message(dialog, "/start")
-            await asyncio.sleep(3)  # Ждем ответа
+        # Если URL не найден, пробуем отправить /start
+        logger.info("URL не найден, отправляем /start")
+        await self._await_bot_reply(client, peer, client.send_message(peer, "/start"))
+        
+        # Повторяем поиск после /start
+        url_or_button = await self.find_button_in_messages(client, peer)
+        if isinstance(url_or_button, str):
+            return url_or_button
+        elif url_or_button:
+            button_text = getattr(url_or_button, 'text', None)
+            if button_text is not None and getattr(url_or_button, 'button', None) is not None:
+                # Если это клавиатурная кнопка
+                logger.info(f"Отправляем текст клавиатурной кнопки: {button_text}")
+                await self._await_bot_reply(client, peer, client.send_message(peer, button_text))
+            else:
+                logger.info("Обрабатываем найденный элемент")
+                click = getattr(url_or_button, 'click', None)
+                if click is not None:
+                    await self._await_bot_reply(client, peer, click())
             
-            # Повторяем поиск после /start
-            url_or_button = await self.find_button_in_messages(client, dialog)
-            if isinstance(url_or_button, str):
-                return url_or_button
-            elif url_or_button:
-                if hasattr(url_or_button, 'text') and hasattr(url_or_button, 'button'):
-                    # Если это клавиатурная кнопка
-                    button_text = url_or_button.text
-                    logger.info(f"Отправляем текст клавиатурной кнопки: {button_text}")
-                    await client.send_message(dialog, button_text)
-                else:
-                    logger.info("Обрабатываем найденный элемент")
-                    if hasattr(url_or_button, 'click'):
-                        await url_or_button.click()
-                
-                await asyncio.sleep(2)
-                async for message in client.iter_messages(dialog, limit=1):
-                    if url := await self.extract_url_from_message(message):
-                        return url
-
-            logger.warning("URL не найден после всех попыток")
+            for message in await asyncio.wait_for(client.get_messages(peer, limit=1), _NET_TIMEOUT):
+                if url := await self.extract_url_from_message(message):
+                    return url
+
+        logger.warning("URL не найден после всех попыток")
+        return None
+
+    @_log_errors("Ошибка поиска кнопки/ссылки")
+    async def find_button_in_messages(self, client: TelegramClient, peer, messages: Optional[List[Message]] = None) -> Union[str, Button, None]:
+        """Поиск кнопки или URL с заданным текстом (messages — уже загруженные сообщения)"""
+        target = self._launch_target_lower
+        logger.info(f"Ищем кнопку/ссылку с текстом: {target}")
+        if not target:
+            logger.warning("TELEGRAM_LAUNCH_BUTTON_TEXT не задан")
             return None
+        
+        if messages is None:
+            messages = await asyncio.wait_for(client.get_messages(peer, limit=20), _NET_TIMEOUT)
+
+        for message in messages:
+            logger.debug(f"Анализ сообщения: {message}")
+
+            # 1. Проверяем title сообщения (если есть)
+            title = getattr(message, 'title', None)
+            if title:
+                if target in title.lower():
+                    logger.info(f"Найден текст в заголовке: {title}")
+                    return message
+
+            # 2. Проверяем текст сообщения
+            text = message.text
+            if text:
+                if target in text.lower():
+                    logger.info(f"Найден текст в сообщении: {text}")
+                    return message
+
+                # Проверяем URL в тексте
+                urls = self.extract_urls_from_text(text)
+                for url in urls:
+                    if target in url.lower():
+                        logger.info(f"Найден URL  тексте сообщения: {url}")
+                        return url
 
-        except Exception as e:
-            logger.error(f"Ошибка обработки чата бота: {e}")
-            return None
-
-    async def find_button_in_messages(self, client: TelegramClient, dialog) -> Union[str, Button, None]:
-        """Поиск кнопки или URL с заданным текстом"""
-        try:
-            launch_button_text = os.getenv("TELEGRAM_LAUNCH_BUTTON_TEXT")
-            logger.info(f"Ищем кнопку/ссылку с текстом: {launch_button_text}")
-            
-            async for message in client.iter_messages(dialog, limit=20):
-                logger.debug(f"Анализ сообщения: {message}")
-
-                # 1. Проверяем title сообщения (если есть)
-                if hasattr(message, 'title') and message.title:
-                    if self._check_button_text(message.title, launch_button_text):
-                        logger.info(f"Найден текст в заголовке: {message.title}")
-                        return message
-
-                # 2. Проверяем текст сообщения
-                if message.text:
-                    if self._check_button_text(message.text, launch_button_text):
-                        logger.info(f"Найден текст в сообщении: {message.text}")
-                        return message
-
-                    # Проверяем URL в тексте
-                    urls = self.extract_urls_from_text(message.text)
-                    for url in urls:
-                        if launch_button_text.lower() in url.lower():
-                            logger.info(f"Найден URL  тексте сообщения: {url}")
-                            return url
-
-                # 3. Проверяем игровые сообщения
-                if hasattr(message, 'game') and message.game:
-                    if hasattr(message.game, 'title') and self._check_button_text(message.game.title, launch_button_text):
-                        logger.info(f"Найдена игровая кнопка: {message.game.title}")
-                        return message.game
-                    if hasattr(message.game, 'short_name') and self._check_button_text(message.game.short_name, launch_button_text):
-                        logger.info(f"Найдена игровая кнопка (short_name): {message.game.short_name}")
-                        return message.game
-
-                # 4. Проверяем медиа-заголовки
-                if message.media and hasattr(message.media, 'title'):
-                    if self._check_button_text(message.media.title, launch_button_text):
-                        logger.info(f"Найден текст в медиа: {message.media.title}")
-                        return message
-
-                # 5. Проверяем inline кнопки и разметку
-                if message.reply_markup:
-                    if hasattr(message.reply_markup, 'rows'):
-                        for row in message.reply_markup.rows:
-                            for button in row.buttons:
-                                # Логируем все найденные кнопки для отладки
-                                logger.debug(f"Проверка кнопки: {button}")
-                                
-                                if self._check_button_text(button.text, launch_button_text):
-                                    # URL-кнопка
-                                    if hasattr(button, 'url'):
-                                        logger.info(f"Найдена URL-кнопка: {button.url}")
-                                        return button.url
-                                    # Игровая кнопка
-                                    if hasattr(button, 'game'):
-                                        logger.info(f"Найдена игровая инлайн-кнопка: {button.text}")
-                                        return button
-                                    # Callback-кнопка
-                                    if hasattr(button, 'callback_data'):
-                                        logger.info(f"Найдена callback-кнопка: {button.text}")
-                                        return button
-                                    # Обычная кнопка
-                                    logger.info(f"Найдена обычная кнопка: {button.text}")
-                                    return button
-
-                # 6. Проверяем нижние кнопки клавиатуры (keyboard buttons)
-                if hasattr(message, 'keyboard') and message.keyboard:
-                    for row in message.keyboard.rows:
-                        for button in row.buttons:
-                            if self._check_button_text(button.text, launch_button_text):
-                                logger.info(f"Найдена клавиатурная кнопка: {button.text}")
+            # 3. Проверяем игровые сообщения
+            game = getattr(message, 'game', None)
+            if game:
+                game_title = getattr(game, 'title', None)
+                if game_title and target in game_title.lower():
+                    logger.info(f"Найдена игровая кнопка: {game_title}")
+                    return game
+                game_short_name = getattr(game, 'short_name', None)
+                if game_short_name and target in game_short_name.lower():
+                    logger.info(f"Найдена игровая кнопка (short_name): {game_short_name}")
+                    return game
+
+            # 4. Проверяем медиа-заголовки
+            media_title = getattr(message.media, 'title', None)
+            if media_title:
+                if target in media_title.lower():
+                    logger.info(f"Найден текст в медиа: {media_title}")
+                    return message
+
+            # 5. Проверяем inline кнопки и разметку
+            rows = getattr(message.reply_markup, 'rows', None)
+            if rows:
+                for row in rows:
+                    for button in row.buttons:
+                        # Логируем все найденные кнопки для отладки
+                        logger.debug(f"Проверка кнопки: {button}")
+                        
+                        button_text = button.text
+                        if button_text and target in button_text.lower():
+                            # URL-кнопка
+                            button_url = getattr(button, 'url', None)
+                            if button_url is not None:
+                                logger.info(f"Найдена URL-кнопка: {button_url}")
+                                return button_url
+                            # Игровая кнопка
+                            if getattr(button, 'game', None) is not None:
+                                logger.info(f"Найдена игровая инлайн-кнопка: {button_text}")
                                 return button
-
-            logger.warning(f"Кнопка/ссылка с текстом '{launch_button_text}' не найдена")
-            return None
-
-        except Exception as e:
-            logger.error(f"Ошибка поиска кнопки/ссылки: {e}")
-            return None
-
+                            # Callback-кнопка
+                            if getattr(button, 'callback_data', None) is not None:
+                                logger.info(f"Найдена callback-кнопка: {button_text}")
+                                return button
+                            # Обычная кнопка
+                            logger.info(f"Найдена обычная кнопка: {button_text}")
+                            return button
+
+            # 6. Проверяем нижние кнопки клавиатуры (keyboard buttons)
+            keyboard = getattr(message, 'keyboard', None)
+            if keyboard:
+                for row in keyboard.rows:
+                    for button in row.buttons:
+                        button_text = button.text
+                        if button_text and target in button_text.lower():
+                            logger.info(f"Найдена клавиатурная кнопка: {button_text}")
+                            return button
+
+        logger.warning(f"Кнопка/ссылка с текстом '{target}' не найдена")
+        return None
+
+    @_log_errors("Ошибка извлечения URL из сообщения")
     async def extract_url_from_message(self, message: Message) -> Optional[str]:
         """Извлечение URL из сообщения"""
-        try:
-            launch_button_text = os.getenv("TELEGRAM_LAUNCH_BUTTON_TEXT")
-            
-            # Проверяем, является ли объект кнопкой клавиатуры
-            if hasattr(message, 'button'):
-                return None  # У клавиатурных кнопок нет URL
-            
-            # Проверяем текст сообщения
-            if hasattr(message, 'text') and message.text:
-                urls = self.extract_urls_from_text(message.text)
-                if urls:
-                    url = urls[0]
-                    if self._check_button_text(url, launch_button_text):
+        # Проверяем, является ли объект кнопкой клавиатуры
+        if getattr(message, 'button', None) is not None:
+            return None  # У клавиатурных кнопок нет URL
+        
+        # Проверяем текст сообщения
+        text = getattr(message, 'text', None)
+        if text:
+            urls = self.extract_urls_from_text(text)
+            if urls:
+                url = urls[0]
+                if self._check_button_text(url):
+                    return url
+                else:
+                    logger.info(f"Найденная ссылка не содержит целевой текст: {url}")
+                    return None
+                
+        # Проверяем entities только если они есть
+        entities = getattr(message, 'entities', None)
+        if entities:
+            for entity in entities:
+                url = getattr(entity, 'url', None)
+                if url:
+                    if self._check_button_text(url):
                         return url
                     else:
-                        logger.info(f"Найденная ссылка не содержит целевой текст: {url}")
+                        logger.info(f"Найдення ссылка в entity не содержит целевой текст: {url}")
                         return None
-                    
-            # Проверяем entities только если они есть
-            if hasattr(message, 'entities') and message.entities:
-                for entity in message.entities:
-                    if hasattr(entity, 'url') and entity.url:
-                        url = entity.url
-                        if self._check_button_text(url, launch_button_text):
+
+        # Проверяем разметку сообщения
+        rows = getattr(getattr(message, 'reply_markup', None), 'rows', None)
+        if rows:
+            for row in rows:
+                for button in row.buttons:
+                    url = getattr(button, 'url', None)
+                    if url is not None:
+                        if self._check_button_text(url):
                             return url
                         else:
-                            logger.info(f"Найдення ссылка в entity не содержит целевой текст: {url}")
+                            logger.info(f"Найденная ссылка в кнопке не содержит целевой текст: {url}")
                             return None
 
-            # Проверяем разметку сообщения
-            if hasattr(message, 'reply_markup') and message.reply_markup:
-                if hasattr(message.reply_markup, 'rows'):
-                    for row in message.reply_markup.rows:
-                        for button in row.buttons:
-                            if hasattr(button, 'url'):
-                                url = button.url
-                                if self._check_button_text(url, launch_button_text):
-                                    return url
-                                else:
-                                    logger.info(f"Найденная ссылка в кнопке не содержит целевой текст: {url}")
-                                    return None
-
-            return None
-        except Exception as e:
-            logger.error(f"Ошибка извлечения URL из сообщения: {e}")
-            return None
+        return None
 
     def extract_urls_from_text(self, text: str) -> List[str]:
         """Извлечение URLs из текста"""
-        import re
-        url_pattern = r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+'
-        return re.findall(url_pattern, text)
+        return _URL_RE.findall(text)
 
-    def _check_button_text(self, button_text: str, target_text: str) -> bool:
+    def _check_button_text(self, button_text: str) -> bool:
         """Провера текста кнопки с учетом эмодзи и других символов"""
-        if not button_text or not target_text:
+        if not button_text or not self._launch_target_lower:
             return False
         
-        # Очищаем строки от пробелов по краям
-        button_text = button_text.strip()
-        target_text = target_text.strip().lower()
-        
         # Проверяем вхождение целевого текста в текст нопки
-        return target_text in button_text.lower()
+        return self._launch_target_lower in button_text.lower()
 
-    async def connect(self) -> Tuple[bool, Optional[str], Optional[dict], Optional[dict], Optional[dict]]:
+    async def connect(self) -> Tuple[bool, Optional[str], Optional[TelegramDeviceConfig], Optional[dict], Optional[dict]]:
         """Подключение к Telegram с расширенным возвратом данных"""
         try:
             logger.info("Начинаем процесс подключения к Telegram")
@@ -493,29 +631,25 @@ class TelegramLogin:
                 else:
                     raise
             
-            await self.client.connect()
+            await asyncio.wait_for(self.client.connect(), _NET_TIMEOUT)
             logger.debug("Установлено соединение с Telegram")
 
-            # Проверка авторизации и вход
+            # Проверка авторизации и вход: результат проверки запоминается, без повторных запросов
             try:
-                if not await self.client.is_user_authorized():
+                authorized = await asyncio.wait_for(self.client.is_user_authorized(), _NET_TIMEOUT)
+                if not authorized:
                     logger.debug("Требуется авторизация")
-                    if not await self.sign_in(self.client):
-                        logger.error("Ошибка при попытке входа")
-                        return False, None, None, None, None
+                    async with self._interactive_lock:
+                        authorized = await self.sign_in(self.client, known_unauthorized=True)
             except AuthKeyUnregisteredError:
                 logger.warning("Сессия недействительна, пересоздаем")
-                if self.session_file.exists():
-                    self.session_file.unlink()
-                if not await self.sign_in(self.client):
-                    logger.error("Ошибка при повторной попытке входа")
-                    return False, None, None, None, None
+                self._remove_session_file()
+                async with self._interactive_lock:
+                    authorized = await self.sign_in(self.client, known_unauthorized=True)
             
-            if not await self.client.is_user_authorized():
-                logger.debug("Клиент не авторизован, начинаем процесс входа")
-                if not await self.sign_in(self.client):
-                    logger.error("Авторизация не удалась")
-                    return False, None, None, None, None
+            if not authorized:
+                logger.error("Авторизация не удалась")
+                return False, None, None, None, None
             
             logger.info("Клиент успешно авторизован")
             
@@ -539,8 +673,30 @@ class TelegramLogin:
     async def cleanup(self):
         """Очистка ресурсов"""
         if self.client and self.client.is_connected():
-            await self.client.disconnect()
-            logger.info("Клиент отключен")
+            try:
+                await asyncio.wait_for(self.client.disconnect(), _NET_TIMEOUT)
+                logger.info("Клиент отключен")
+            except asyncio.TimeoutError:
+                logger.warning("Таймаут отключения клиента")
+
+    @classmethod
+    async def connect_many(cls, specs: Iterable[Tuple[int, str, str]]) -> List[Tuple["TelegramLogin", Any]]:
+        """Параллельное подключение нескольких аккаунтов (api_id, api_hash, phone).
+
+        Одновременно выполняется не больше MAX_CONCURRENT_CONNECTS подключений,
+        чтобы не упираться в FloodWait на рукопожатиях с DC. Интерактивный вход
+        выполняется по одному аккаунту за раз (_interactive_lock). Возвращает пары
+        (TelegramLogin, результат connect() или исключение).
+        """
+        semaphore = asyncio.Semaphore(cls.MAX_CONCURRENT_CONNECTS)
+        logins = [cls(*spec) for spec in specs]
+
+        async def connect_one(login: "TelegramLogin"):
+            async with semaphore:
+                return await login.connect()
+
+        results = await asyncio.gather(*(connect_one(login) for login in logins), return_exceptions=True)
+        return list(zip(logins, results))
 
 if __name__ == "__main__":
     # Для тестирования
@@ -550,6 +706,14 @@ if __name__ == "__main__":
     phone = os.getenv("TELEGRAM_PHONE")
     
     if all([api_id, api_hash, phone]):
-        initialize_login(api_id, api_hash, phone)
+        async def _check_logins():
+            # Несколько номеров можно перечислить через запятую
+            phones = [p.strip() for p in phone.split(',') if p.strip()]
+            results = await TelegramLogin.connect_many((int(api_id), api_hash, p) for p in phones)
+            for login, result in results:
+                print(login.phone, result if isinstance(result, BaseException) else result[:2])
+                await login.cleanup()
+
+        asyncio.run(_check_logins())
     else:
         print("Отсутствуют необходимые переменные окружения")
\ No newline at end of file
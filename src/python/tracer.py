@@ -1,31 +1,50 @@
 # tracer.py
 
+import asyncio
+import itertools
 import os
+from collections import deque
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, List
 from loguru import logger
 from playwright.async_api import Page
-import json
+import orjson
+from device_emulation import TelegramDeviceConfig
+from utils import ensure_dir
+
+TELEGRAM_TRACKER_JS = str(Path(__file__).parent / "trackers" / "telegram_tracker.js")
 
 class TracerManager:
-    def __init__(self, page: Page, device_config: Dict[str, Any]):
+    # Ёмкость очереди событий и максимальный размер пачки на одну запись
+    QUEUE_SIZE = 4096
+    BATCH_SIZE = 256
+    # Сколько последних взаимодействий держать в памяти (полная история - в interactions.jsonl)
+    MAX_VISUAL_INTERACTIONS = 4096
+    # Счётчик трейсов процесса: разводит директории, созданные в одну и ту же секунду
+    _trace_seq = itertools.count()
+
+    def __init__(self, page: Page, device_config: TelegramDeviceConfig):
         self.page = page
         self.device_config = device_config
         self.trace_dir = Path("./recordings/tracer")
         self.current_trace_dir = None
         self.is_tracing = False
-        self.visual_interactions = []
+        self.visual_interactions = deque(maxlen=self.MAX_VISUAL_INTERACTIONS)
         self._setup_directories()
+        # interactions.jsonl открывается в start_tracing и закрывается в stop_tracing
+        self._interactions_fp = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
         logger.info("Инициализирован TracerManager")
 
     def _setup_directories(self):
         """Создание необходимых директорий"""
         try:
-            self.trace_dir.mkdir(parents=True, exist_ok=True)
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            self.current_trace_dir = self.trace_dir / f"trace_{timestamp}"
-            self.current_trace_dir.mkdir(parents=True, exist_ok=True)
+            self.current_trace_dir = self.trace_dir / f"trace_{timestamp}_{next(self._trace_seq):03d}"
+            # Один mkdir вместе с родительской директорией трейсов
+            ensure_dir(self.current_trace_dir)
             logger.info(f"Создана директория для трейсов: {self.current_trace_dir}")
         except Exception as e:
             logger.error(f"Ошибка создания директорий трейсера: {e}")
@@ -36,172 +55,27 @@ class TracerManager:
         try:
             self.is_tracing = True
             logger.info("Начало трейсинга...")
+            # interactions.jsonl: одна JSON-строка на событие (UTF-8 байты от orjson)
+            self._interactions_fp = open(self.current_trace_dir / 'interactions.jsonl', 'ab')
+            # Обработчик binding только кладёт события в очередь, запись на диск - в фоновой задаче
+            self._queue = asyncio.Queue(maxsize=self.QUEUE_SIZE)
+            self._writer_task = asyncio.create_task(self._drain())
             await self._inject_advanced_tracker()
             logger.info("Трейсинг успешно запущен")
         except Exception as e:
             logger.error(f"Ошибка запуска трейсинга: {e}")
             self.is_tracing = False
+            await self._stop_writer()
             raise
 
     async def _inject_advanced_tracker(self):
         """Инжектирование продвинутого трекера для Telegram Mini Apps"""
         try:
-            script = """
-            window.telegramTracker = {
-                events: [],
-                interactions: [],
-                _state: {
-                    lastViewportHeight: 0,
-                    lastState: null,
-                    interactionPoints: []
-                },
-
-                // Основная функция логирования
-                logEvent: function(event) {
-                    const tg = window.Telegram?.WebApp;
-                    if (!tg) return;
-
-                    const baseState = {
-                        viewportHeight: tg.viewportHeight,
-                        viewportStableHeight: tg.viewportStableHeight,
-                        viewportWidth: window.innerWidth || document.documentElement.clientWidth
-                    };
-
-                    const enrichedEvent = {
-                        ...event,
-                        timestamp: Date.now(),
-                        coordinates: event.coordinates || this._state.interactionPoints[this._state.interactionPoints.length - 1],
-                        webAppState: baseState
-                    };
-
-                    this._saveEvent(enrichedEvent);
-                },
-
-                // Проверка изменения состояния
-                _hasStateChanged: function() {
-                    const tg = window.Telegram?.WebApp;
-                    if (!tg) return false;
-
-                    const currentState = {
-                        height: tg.viewportHeight,
-                        expanded: tg.isExpanded
-                    };
-
-                    const changed = JSON.stringify(currentState) !== JSON.stringify(this._state.lastState);
-                    this._state.lastState = currentState;
-                    return changed;
-                },
-
-                // Сохранение события
-                _saveEvent: function(event) {
-                    this.events.push(event);
-                    console.log('TELEGRAM_TRACKER_EVENT:', JSON.stringify(event));
-                },
-
-                // Отслеживание событий DOM
-                _trackDOMEvents: function() {
-                    const trackableEvents = ['click', 'touchstart', 'touchend'];
-                    
-                    trackableEvents.forEach(eventName => {
-                        document.addEventListener(eventName, (e) => {
-                            // Пропускаем все события связанные с canvas
-                            if (e.target.tagName === 'CANVAS') {
-                                return;
-                            }
-
-                            const coordinates = {
-                                x: e instanceof MouseEvent ? e.clientX : e.touches[0].clientX,
-                                y: e instanceof MouseEvent ? e.clientY : e.touches[0].clientY
-                            };
-
-                            this._state.interactionPoints.push(coordinates);
-                            if (this._state.interactionPoints.length > 10) {
-                                this._state.interactionPoints.shift();
-                            }
-
-                            // Получаем текст элемента
-                            let elementText = '';
-                            if (e.target.tagName === 'DIV') {
-                                elementText = e.target.textContent?.trim() || '';
-                            }
-
-                            const eventData = {
-                                type: 'dom_event',
-                                event: eventName,
-                                target: {
-                                    tagName: e.target.tagName,
-                                    className: e.target.className,
-                                    id: e.target.id,
-                                    text: elementText
-                                },
-                                coordinates: coordinates
-                            };
-
-                            this.logEvent(eventData);
-                        }, true);
-                    });
-                },
+            # События приходят из страницы уже десериализованными, минуя консоль
+            await self.page.expose_binding("__trackerEvent", lambda source, event: self._enqueue(event))
 
-                // Отслеживание событий WebApp
-                _trackWebAppEvents: function() {
-                    const tg = window.Telegram?.WebApp;
-                    if (!tg) return;
-
-                    const events = [
-                        'viewportChanged'
-                    ];
-                    
-                    events.forEach(event => {
-                        tg.onEvent(event, (data) => {
-                            const eventData = {
-                                type: 'webapp_event',
-                                name: event,
-                                data: data
-                            };
-
-                            if (event === 'viewportChanged') {
-                                eventData.viewport = {
-                                    height: tg.viewportHeight,
-                                    stableHeight: tg.viewportStableHeight,
-                                    previousHeight: this._state.lastViewportHeight
-                                };
-                                this._state.lastViewportHeight = tg.viewportHeight;
-                            }
-
-                            this.logEvent(eventData);
-                        });
-                    });
-                },
-
-                // Инициализация
-                init: function() {
-                    this._trackWebAppEvents();
-                    this._trackDOMEvents();
-                    
-                    this.logEvent({
-                        type: 'tracker_initialized',
-                        timestamp: Date.now()
-                    });
-                }
-            };
-
-            // Запуск после инициализации WebApp
-            const initTracker = () => {
-                if (window.Telegram?.WebApp) {
-                    window.telegramTracker.init();
-                } else {
-                    setTimeout(initTracker, 100);
-                }
-            };
-            
-            initTracker();
-            """;
-
-            # Инжектируем скрипт
-            await self.page.add_init_script(script)
-            
-            # Добавляем слушатель консоли
-            self.page.on("console", self._handle_tracker_event)
+            # Инжектируем скрипт из файла: Playwright читает его сам, строка не собирается в Python
+            await self.page.add_init_script(path=TELEGRAM_TRACKER_JS)
             
             logger.info("Продвинутый трекер для Telegram Mini Apps успешно инжектирован")
         
@@ -209,44 +83,71 @@ class TracerManager:
             logger.error(f"Ошибка инжектирования трекера: {e}")
             raise
 
-    async def _handle_tracker_event(self, msg):
-        """Обработка событий трекера из консоли"""
-        try:
-            if msg.text.startswith('TELEGRAM_TRACKER_EVENT:'):
-                event_data = json.loads(msg.text.replace('TELEGRAM_TRACKER_EVENT:', ''))
-                await self._handle_interaction(event_data)
-        except Exception as e:
-            logger.error(f"Ошибка обработки события трекера: {e}")
-
-    async def _handle_interaction(self, interaction: Dict):
-        """Обработка взаимодействий"""
+    def _enqueue(self, interaction: Dict):
+        """Неблокирующая постановка события в очередь записи (при переполнении вытесняется самое старое)"""
+        if not self.is_tracing or self._queue is None:
+            return
+        if self._queue.full():
+            self._queue.get_nowait()
+            logger.warning("Очередь событий трекера переполнена, самое старое событие отброшено")
+        self._queue.put_nowait(interaction)
+
+    async def _drain(self):
+        """Фоновая запись событий из очереди пачками, None в очереди - сигнал остановки"""
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            batch = []
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= self.BATCH_SIZE or self._queue.empty():
+                    break
+                item = self._queue.get_nowait()
+            stopping = item is None
+
+            if batch:
+                await self._handle_interactions(batch)
+
+    def _write_lines(self, lines: bytes):
+        """Запись пачки строк одним вызовом write"""
+        self._interactions_fp.write(lines)
+        self._interactions_fp.flush()
+
+    async def _handle_interactions(self, batch: List[Dict]):
+        """Обработка пачки взаимодействий"""
         try:
-            self.visual_interactions.append(interaction)
+            self.visual_interactions.extend(batch)
             
-            # Сохраняем в файл
-            interactions_file = self.current_trace_dir / 'interactions.json'
-            
-            existing_data = []
-            if interactions_file.exists():
-                with open(interactions_file, 'r', encoding='utf-8') as f:
-                    existing_data = json.load(f)
-                    
-            existing_data.append(interaction)
-            
-            with open(interactions_file, 'w', encoding='utf-8') as f:
-                json.dump(existing_data, f, indent=2, ensure_ascii=False)
+            # Дописываем строки в конец файла, без перечитывания и перезаписи
+            lines = b''.join(orjson.dumps(interaction) + b'\n' for interaction in batch)
+            await asyncio.to_thread(self._write_lines, lines)
                 
-            logger.debug(f"Записано взаимодействие: {interaction['type']} - {interaction.get('action')}")
+            logger.debug(f"Записано взаимодействий: {len(batch)}, последнее: {batch[-1].get('type')} - {batch[-1].get('action')}")
             
         except Exception as e:
             logger.error(f"Ошибка обработки взаимодействия: {e}")
 
+    async def _stop_writer(self):
+        """Дописывает очередь событий, останавливает фоновую запись и закрывает файл"""
+        if self._writer_task:
+            # Фоновая задача дописывает очередь до сигнала и завершается сама:
+            # отмена могла бы прервать запись, пока поток еще пишет в файл
+            await self._queue.put(None)
+            await self._writer_task
+            self._writer_task = None
+            self._queue = None
+        if self._interactions_fp:
+            self._interactions_fp.close()
+            self._interactions_fp = None
+
     async def stop_tracing(self):
         """Остановка трейсинга"""
         if not self.is_tracing:
             return
         try:
+            # После сброса флага новые события не принимаются, поэтому сигнал остановки не будет вытеснен
             self.is_tracing = False
+            await self._stop_writer()
             logger.info("Трейсинг успешно остановлен")
         except Exception as e:
             logger.error(f"Ошибка остановки трейсинга: {e}")
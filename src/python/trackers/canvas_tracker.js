@@ -0,0 +1,38 @@
+// Трекер кликов по игровому canvas (выполняется в уже загруженной странице через page.evaluate)
+window.canvasTracker = {
+    // Кольцевой буфер последних 1024 взаимодействий (ёмкость - степень двойки)
+    _buf: new Array(1024),
+    _head: 0,
+    _count: 0,
+
+    logInteraction: function(event) {
+        const interaction = {
+            type: event.type,
+            coordinates: {
+                x: event.clientX,
+                y: event.clientY
+            },
+            timestamp: Date.now(),
+            target: {
+                id: event.target.id,
+                type: event.target.tagName.toLowerCase()
+            }
+        };
+
+        this._buf[this._head] = interaction;
+        this._head = (this._head + 1) & 1023;
+        if (this._count < 1024) this._count++;
+        window.__canvasEvent(interaction);
+    },
+
+    init: function() {
+        const canvas = document.querySelector('#GameCanvas');
+        if (!canvas) return;
+
+        ['click'].forEach(eventType => {
+            canvas.addEventListener(eventType, this.logInteraction.bind(this));
+        });
+    }
+};
+
+window.canvasTracker.init();
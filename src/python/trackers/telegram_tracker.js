@@ -0,0 +1,189 @@
+// Трекер взаимодействий Telegram Mini App (внедряется через add_init_script)
+window.telegramTracker = {
+    // Кольцевой буфер последних 1024 событий (ёмкость - степень двойки)
+    _buf: new Array(1024),
+    _head: 0,
+    _count: 0,
+    _state: {
+        lastViewportHeight: 0,
+        // Ширина viewport: обновляется по resize/viewportChanged, чтобы не читать clientWidth на каждом событии
+        viewportWidth: 0,
+        lastState: null,
+        // Последние 10 точек касаний: кольцевой буфер на типизированных массивах
+        pointsX: new Int16Array(10),
+        pointsY: new Int16Array(10),
+        pointsHead: 0,
+        pointsCount: 0
+    },
+
+    // Последняя сохраненная точка взаимодействия
+    _latestPoint: function() {
+        const s = this._state;
+        if (!s.pointsCount) return undefined;
+        const i = (s.pointsHead + 9) % 10;
+        return { x: s.pointsX[i], y: s.pointsY[i] };
+    },
+
+    // Основная функция логирования
+    logEvent: function(event) {
+        const tg = window.Telegram?.WebApp;
+        if (!tg) return;
+
+        // Событие всегда создается вызывающим кодом заново, поэтому дополняем его на месте без копирования.
+        // webAppState остается отдельным объектом на событие: события хранятся в кольцевом буфере
+        event.timestamp = Date.now();
+        if (!event.coordinates) event.coordinates = this._latestPoint();
+        event.webAppState = {
+            viewportHeight: tg.viewportHeight,
+            viewportStableHeight: tg.viewportStableHeight,
+            viewportWidth: this._state.viewportWidth
+        };
+
+        this._saveEvent(event);
+    },
+
+    // Проверка изменения состояния
+    _hasStateChanged: function() {
+        const tg = window.Telegram?.WebApp;
+        if (!tg) return false;
+
+        const currentState = {
+            height: tg.viewportHeight,
+            expanded: tg.isExpanded
+        };
+
+        const last = this._state.lastState;
+        const changed = !last || last.height !== currentState.height || last.expanded !== currentState.expanded;
+        this._state.lastState = currentState;
+        return changed;
+    },
+
+    // Сохранение события
+    _saveEvent: function(event) {
+        this._buf[this._head] = event;
+        this._head = (this._head + 1) & 1023;
+        if (this._count < 1024) this._count++;
+        window.__trackerEvent(event);
+    },
+
+    // Отслеживание событий DOM: один общий пассивный обработчик на фазе перехвата
+    _trackDOMEvents: function() {
+        const trackableEvents = new Set(['click', 'touchstart', 'touchend']);
+
+        const onEvent = (e) => {
+            // Пропускаем все события связанные с canvas
+            if (!trackableEvents.has(e.type) || e.target.tagName === 'CANVAS') {
+                return;
+            }
+
+            // У touchend список touches уже пуст, точка касания есть только в changedTouches
+            const point = e.changedTouches ? e.changedTouches[0] : e;
+            const coordinates = {
+                x: point.clientX,
+                y: point.clientY
+            };
+
+            const state = this._state;
+            state.pointsX[state.pointsHead] = coordinates.x | 0;
+            state.pointsY[state.pointsHead] = coordinates.y | 0;
+            state.pointsHead = (state.pointsHead + 1) % 10;
+            if (state.pointsCount < 10) state.pointsCount++;
+
+            // Получаем текст элемента
+            let elementText = '';
+            if (e.target.tagName === 'DIV') {
+                elementText = e.target.textContent?.trim() || '';
+            }
+
+            const eventData = {
+                type: 'dom_event',
+                event: e.type,
+                target: {
+                    tagName: e.target.tagName,
+                    className: e.target.className,
+                    id: e.target.id,
+                    text: elementText
+                },
+                coordinates: coordinates
+            };
+
+            this.logEvent(eventData);
+        };
+
+        // Трекер только наблюдает и не вызывает preventDefault, поэтому слушатели пассивные
+        trackableEvents.forEach(eventName => {
+            document.addEventListener(eventName, onEvent, { capture: true, passive: true });
+        });
+    },
+
+    // Отслеживание событий WebApp
+    _trackWebAppEvents: function() {
+        const tg = window.Telegram?.WebApp;
+        if (!tg) return;
+
+        // viewportChanged приходит пачками (например, при выезде клавиатуры):
+        // пишем не больше одного события за кадр, с последними данными пачки
+        let pending = null;
+        let rafId = 0;
+
+        tg.onEvent('viewportChanged', (data) => {
+            pending = data;
+            if (rafId) return;
+
+            rafId = requestAnimationFrame(() => {
+                rafId = 0;
+                const eventData = {
+                    type: 'webapp_event',
+                    name: 'viewportChanged',
+                    data: pending,
+                    viewport: {
+                        height: tg.viewportHeight,
+                        stableHeight: tg.viewportStableHeight,
+                        previousHeight: this._state.lastViewportHeight
+                    }
+                };
+                pending = null;
+                this._state.lastViewportHeight = tg.viewportHeight;
+                this._updateViewportWidth();
+
+                this.logEvent(eventData);
+            });
+        });
+    },
+
+    // Инициализация
+    _updateViewportWidth: function() {
+        this._state.viewportWidth = window.innerWidth || document.documentElement.clientWidth;
+    },
+
+    init: function() {
+        this._updateViewportWidth();
+        window.addEventListener('resize', () => this._updateViewportWidth(), { passive: true });
+        this._trackWebAppEvents();
+        this._trackDOMEvents();
+
+        this.logEvent({
+            type: 'tracker_initialized',
+            timestamp: Date.now()
+        });
+    }
+};
+
+// Запуск после инициализации WebApp. Скрипт Telegram подключается синхронно,
+// поэтому объект WebApp доступен к DOMContentLoaded (в крайнем случае к load) - без опроса по таймеру
+// (в отдельной области видимости, чтобы не пересекаться с глобальными именами страницы)
+(() => {
+    const initTracker = () => {
+        if (!window.Telegram?.WebApp) return false;
+        window.telegramTracker.init();
+        return true;
+    };
+
+    if (!initTracker()) {
+        document.addEventListener('DOMContentLoaded', () => {
+            if (!initTracker()) {
+                window.addEventListener('load', initTracker, { once: true });
+            }
+        }, { once: true });
+    }
+})();
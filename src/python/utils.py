@@ -1,29 +1,60 @@
 import asyncio
+import itertools
 import random
+import time
 from datetime import datetime
 import os
 from pathlib import Path
-from typing import Optional
+from typing import Any, Dict, Optional, Set
 import ffmpeg
 from loguru import logger
 
+# Собственный генератор модуля для задержек и скролла, независимый от глобального random
+_rng = random.Random()
+
+# Директории, уже созданные этим процессом: повторный mkdir (и его stat) для них не нужен
+_ENSURED: Set[str] = set()
+
+def ensure_dir(path: Path):
+    """Создает директорию (вместе с родителями) один раз за время жизни процесса"""
+    key = str(path)
+    if key in _ENSURED:
+        return
+    path.mkdir(parents=True, exist_ok=True)
+    _ENSURED.add(key)
+
 class HumanBehavior:
     """Класс для имитации человеческого поведения"""
     
     @staticmethod
     async def random_delay():
         """Генерирует случайную задержку от 0.450 до 1.050 секунд с возможностью десятичных значений"""
-        delay = round(random.uniform(0.450, 1.050), 3)
+        delay = _rng.uniform(0.450, 1.050)
+        await asyncio.sleep(delay)
+        return delay
+    
+    @staticmethod
+    async def combined_delay(n: int = 2, base: float = 0.0):
+        """
+        Одна пауза вместо n последовательных random_delay (плюс фиксированная пауза base),
+        чтобы не ставить несколько таймеров подряд
+        """
+        delay = base + sum(_rng.uniform(0.450, 1.050) for _ in range(n))
         await asyncio.sleep(delay)
         return delay
     
     @staticmethod
     async def random_scroll():
         """Генерирует случайный скролл"""
-        return random.randint(100, 500)
+        return _rng.randint(100, 500)
 
 class ScreenRecorder:
     """Класс для управления записью экрана и скриншотами"""
+    # Размер очереди фоновой записи и максимальный размер пачки файлов за один проход
+    SCREENSHOT_QUEUE_SIZE = 8
+    SCREENSHOT_BATCH_SIZE = 4
+    SCREENSHOT_JPEG_QUALITY = 60
+
     def __init__(self, output_dir: str = "./recordings", enable_video: bool = False, enable_screenshots: bool = True):
         self.output_dir = Path(output_dir)
         self.screenshots_dir = self.output_dir / "screenshots"
@@ -35,28 +66,137 @@ class ScreenRecorder:
         
         # Создаем директории если включена соответствующая функция
         if self.enable_screenshots:
-            self.screenshots_dir.mkdir(parents=True, exist_ok=True)
+            ensure_dir(self.screenshots_dir)
         if self.enable_video:
-            self.videos_dir.mkdir(parents=True, exist_ok=True)
+            ensure_dir(self.videos_dir)
+
+        # Метка сессии считается один раз, уникальность имён файлов обеспечивает счётчик
+        self._session = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self._seq = itertools.count()
+        # Строковые префиксы директорий: пути собираются f-строкой без промежуточных Path
+        self._shots_prefix = str(self.screenshots_dir) + os.sep
+        self._videos_prefix = str(self.videos_dir) + os.sep
+
+        # Фоновая запись скриншотов: очередь (путь, байты) и задача-писатель
+        self._shot_queue: Optional[asyncio.Queue] = None
+        self._shot_task: Optional[asyncio.Task] = None
+
+        # При включенном видео вместо кадров пишутся метки действий: смещение от начала записи и имя действия
+        self._video_started: Optional[float] = None
+        self._markers_fp = None
             
+    def video_context_options(self, width: int, height: int) -> Dict[str, Any]:
+        """
+        Параметры browser.new_context для непрерывной записи видео самим Chromium.
+        Пустой словарь, если видео выключено
+        """
+        if not self.enable_video:
+            return {}
+        self._video_started = time.monotonic()
+        return {
+            "record_video_dir": str(self.videos_dir),
+            "record_video_size": {"width": width, "height": height}
+        }
+
+    def _mark_action(self, action_name: str):
+        """Метка действия в индексе видео (markers_<сессия>.tsv)"""
+        try:
+            if self._markers_fp is None:
+                self._markers_fp = open(f"{self._videos_prefix}markers_{self._session}.tsv", 'a', encoding='utf-8', buffering=1)
+            started = self._video_started if self._video_started is not None else time.monotonic()
+            self._markers_fp.write(f"{time.monotonic() - started:.3f}\t{action_name}\n")
+        except Exception as e:
+            logger.error(f"Ошибка записи метки видео: {e}")
+
     def get_screenshot_path(self, action_name: str) -> str:
         """Генерирует путь для скриншота"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        return str(self.screenshots_dir / f"{action_name}_{timestamp}.png")
+        return f"{self._shots_prefix}{action_name}_{self._session}_{next(self._seq):06d}.png"
     
     def get_video_path(self) -> str:
         """Генерирует путь для видео"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        return str(self.videos_dir / f"session_{timestamp}.mp4")
+        return f"{self._videos_prefix}session_{self._session}_{next(self._seq):06d}.mp4"
     
-    async def take_screenshot(self, page, action_name: str):
-        """Делает скриншот текущего состояния страницы"""
+    async def take_screenshot(self, page, action_name: str, full_page: bool = False):
+        """
+        Делает PNG скриншот текущего состояния страницы (для итоговых и проверочных кадров).
+        По умолчанию снимается только viewport: full_page=True заставляет браузер перекомпоновать весь документ.
+        При записи видео кадр не снимается, в индекс видео пишется метка действия
+        """
+        if self.enable_video:
+            self._mark_action(action_name)
+            return
         if not self.enable_screenshots:
             return
             
         try:
             screenshot_path = self.get_screenshot_path(action_name)
-            await page.screenshot(path=screenshot_path, full_page=True)
+            await page.screenshot(path=screenshot_path, full_page=full_page)
             logger.info(f"Сделан скриншот действия '{action_name}': {screenshot_path}")
         except Exception as e:
-            logger.error(f"Ошибка при создании скриншота: {e}")
\ No newline at end of file
+            logger.error(f"Ошибка при создании скриншота: {e}")
+
+    async def enqueue_screenshot(self, page, action_name: str):
+        """
+        Снимает JPEG кадр и передает его фоновому писателю без ожидания записи на диск.
+        Если очередь заполнена, кадр отбрасывается. При записи видео вместо кадра пишется метка действия
+        """
+        if self.enable_video:
+            self._mark_action(action_name)
+            return
+        if not self.enable_screenshots:
+            return
+
+        if self._shot_task is None:
+            self._shot_queue = asyncio.Queue(maxsize=self.SCREENSHOT_QUEUE_SIZE)
+            self._shot_task = asyncio.create_task(self._screenshot_writer())
+
+        try:
+            image = await page.screenshot(type='jpeg', quality=self.SCREENSHOT_JPEG_QUALITY)
+            path = f"{self._shots_prefix}{action_name}_{self._session}_{next(self._seq):06d}.jpg"
+            self._shot_queue.put_nowait((path, image))
+        except asyncio.QueueFull:
+            logger.debug(f"Очередь скриншотов заполнена, кадр '{action_name}' пропущен")
+        except Exception as e:
+            logger.error(f"Ошибка при создании скриншота: {e}")
+
+    @staticmethod
+    def _write_batch(batch: list):
+        """Запись пачки скриншотов с одним fsync в конце"""
+        for i, (path, image) in enumerate(batch):
+            with open(path, 'wb') as f:
+                f.write(image)
+                if i == len(batch) - 1:
+                    f.flush()
+                    os.fsync(f.fileno())
+
+    async def _screenshot_writer(self):
+        """Фоновая задача: забирает скриншоты из очереди и пишет их пачками в пуле потоков"""
+        stopping = False
+        while not stopping:
+            item = await self._shot_queue.get()
+            batch = []
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= self.SCREENSHOT_BATCH_SIZE or self._shot_queue.empty():
+                    break
+                item = self._shot_queue.get_nowait()
+            stopping = item is None
+
+            if batch:
+                try:
+                    await asyncio.to_thread(self._write_batch, batch)
+                    logger.debug(f"Записано скриншотов: {len(batch)}")
+                except Exception as e:
+                    logger.error(f"Ошибка записи скриншотов: {e}")
+
+    async def stop_writer(self):
+        """Дописывает оставшиеся скриншоты и останавливает фоновую запись"""
+        if self._markers_fp is not None:
+            self._markers_fp.close()
+            self._markers_fp = None
+        if self._shot_task is None:
+            return
+        await self._shot_queue.put(None)
+        await self._shot_task
+        self._shot_task = None
+        self._shot_queue = None
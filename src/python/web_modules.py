@@ -1,90 +1,107 @@
 import asyncio
+import itertools
+from functools import lru_cache
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List
 from loguru import logger
 from playwright.async_api import Page
-import json
+import orjson
+from utils import ensure_dir
+
+CANVAS_TRACKER_JS = Path(__file__).parent / "trackers" / "canvas_tracker.js"
+
+@lru_cache(maxsize=1)
+def _canvas_tracker_js() -> str:
+    """Текст трекера canvas, читается с диска один раз за процесс"""
+    return CANVAS_TRACKER_JS.read_text(encoding='utf-8')
 
 class CanvasInteractionTracker:
     """Класс для отслеживания взаимодействий с canvas"""
+    QUEUE_SIZE = 4096
+    BATCH_SIZE = 256
+    # Счётчик сессий процесса: разводит файлы трекеров, созданных в одну и ту же секунду
+    _session_seq = itertools.count()
+
     def __init__(self, page: Page):
         self.page = page
         self.trace_dir = Path("./recordings/tracer/canvas")
-        self.current_session = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.current_session = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{next(self._session_seq):03d}"
         self.setup_trace_directory()
+        # Файл взаимодействий открывается в start_tracking и закрывается в stop_tracking
+        self._interactions_fp = None
+        self.is_tracking = False
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
         
     def setup_trace_directory(self):
         """Создание директории для логов"""
-        self.trace_dir.mkdir(parents=True, exist_ok=True)
+        ensure_dir(self.trace_dir)
         
     async def start_tracking(self):
         """Запуск отслеживания взаимодействий"""
-        await self.page.evaluate("""
-            () => {
-                window.canvasTracker = {
-                    interactions: [],
-                    
-                    logInteraction: function(event) {
-                        const interaction = {
-                            type: event.type,
-                            coordinates: {
-                                x: event.clientX,
-                                y: event.clientY
-                            },
-                            timestamp: Date.now(),
-                            target: {
-                                id: event.target.id,
-                                type: event.target.tagName.toLowerCase()
-                            }
-                        };
-                        
-                        this.interactions.push(interaction);
-                        console.log('CANVAS_INTERACTION:', JSON.stringify(interaction));
-                    },
-                    
-                    init: function() {
-                        const canvas = document.querySelector('#GameCanvas');
-                        if (!canvas) return;
-                        
-                        ['click'].forEach(eventType => {
-                            canvas.addEventListener(eventType, this.logInteraction.bind(this));
-                        });
-                    }
-                };
-                
-                window.canvasTracker.init();
-            }
-        """)
-        
-        # Добавляем обработчик консоли для логирования
-        self.page.on("console", self._handle_interaction_event)
-        
-    async def _handle_interaction_event(self, msg):
-        """Обработка событий взаимодействия"""
-        try:
-            if msg.text.startswith('CANVAS_INTERACTION:'):
-                interaction_data = json.loads(msg.text.replace('CANVAS_INTERACTION:', ''))
-                await self._save_interaction(interaction_data)
-        except Exception as e:
-            logger.error(f"Ошибка обработки события взаимодействия: {e}")
+        self._interactions_fp = open(
+            self.trace_dir / f"canvas_interactions_{self.current_session}.jsonl", 'ab'
+        )
+        self.is_tracking = True
+        # Запись на диск идёт в фоновой задаче, обработчик binding только ставит события в очередь
+        self._queue = asyncio.Queue(maxsize=self.QUEUE_SIZE)
+        self._writer_task = asyncio.create_task(self._drain())
+        # События приходят из страницы уже десериализованными, минуя консоль
+        await self.page.expose_binding("__canvasEvent", lambda source, interaction: self._enqueue(interaction))
+        # Canvas уже на странице, поэтому скрипт выполняется сразу, а не через add_init_script
+        await self.page.evaluate(_canvas_tracker_js())
+
+    def _enqueue(self, interaction: Dict):
+        """Неблокирующая постановка события в очередь (при переполнении вытесняется самое старое)"""
+        if not self.is_tracking:
+            return
+        if self._queue.full():
+            self._queue.get_nowait()
+            logger.warning("Очередь событий canvas переполнена, самое старое событие отброшено")
+        self._queue.put_nowait(interaction)
+
+    async def _drain(self):
+        """Фоновая запись событий из очереди пачками, None в очереди - сигнал остановки"""
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            batch = []
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= self.BATCH_SIZE or self._queue.empty():
+                    break
+                item = self._queue.get_nowait()
+            stopping = item is None
+
+            if batch:
+                await self._save_interactions(batch)
+
+    async def stop_tracking(self):
+        """Дописывает очередь взаимодействий, останавливает фоновую запись и закрывает файл"""
+        # После сброса флага новые события не принимаются, поэтому сигнал остановки не будет вытеснен
+        self.is_tracking = False
+        if self._writer_task:
+            await self._queue.put(None)
+            await self._writer_task
+            self._writer_task = None
+            self._queue = None
+        if self._interactions_fp:
+            self._interactions_fp.close()
+            self._interactions_fp = None
+
+    def _write_lines(self, lines: bytes):
+        """Запись пачки строк одним вызовом write"""
+        self._interactions_fp.write(lines)
+        self._interactions_fp.flush()
             
-    async def _save_interaction(self, interaction: Dict):
-        """Сохранение взаимодействия в файл"""
+    async def _save_interactions(self, batch: List[Dict]):
+        """Сохранение пачки взаимодействий в файл"""
         try:
-            file_path = self.trace_dir / f"canvas_interactions_{self.current_session}.json"
-            
-            existing_data = []
-            if file_path.exists():
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    existing_data = json.load(f)
-                    
-            existing_data.append(interaction)
-            
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(existing_data, f, indent=2, ensure_ascii=False)
+            lines = b''.join(orjson.dumps(interaction) + b'\n' for interaction in batch)
+            await asyncio.to_thread(self._write_lines, lines)
                 
-            logger.debug(f"Записано взаимодействие с canvas: {interaction['type']}")
+            logger.debug(f"Записано взаимодействий с canvas: {len(batch)}")
             
         except Exception as e:
             logger.error(f"Ошибка сохранения взаимодействия: {e}")
@@ -97,8 +114,8 @@ class GameCanvasHandler:
 
     async def initialize(self) -> bool:
         try:
-            # Ждем загрузки страницы
-            await self.page.wait_for_load_state('networkidle')
+            # Ждем появления canvas игры (networkidle не наступает из-за постоянных соединений)
+            await self.page.wait_for_selector('canvas', state='attached')
             logger.info("Страница для web_modules успешно загружена")
                 
             await self.tracker.start_tracking()
@@ -107,4 +124,9 @@ class GameCanvasHandler:
             
         except Exception as e:
             logger.error(f"Ошибка инициализации canvas: {e}")
-            return False
\ No newline at end of file
+            await self.tracker.stop_tracking()
+            return False
+
+    async def cleanup(self):
+        """Остановка отслеживания взаимодействий с canvas"""
+        await self.tracker.stop_tracking()
\ No newline at end of file
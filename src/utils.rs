@@ -35,19 +35,54 @@ pub fn try_import_package(py: Python<'_>, package: &str) -> Result<()> {
     ))
 }
 
-/// Парсит файл requirements.txt и возвращает список пакетов
+/// Значение sys_platform из PEP 508 для текущей платформы
+fn current_sys_platform() -> &'static str {
+    if cfg!(target_os = "windows") {
+        "win32"
+    } else if cfg!(target_os = "macos") {
+        "darwin"
+    } else {
+        "linux"
+    }
+}
+
+/// Проверяет маркер окружения строки requirements (часть после ';').
+/// Поддерживаются сравнения sys_platform через == и !=, остальные маркеры считаются выполненными
+fn marker_matches(marker: &str) -> bool {
+    let marker = marker.trim();
+    for (op, equal) in [("!=", false), ("==", true)] {
+        if let Some((key, value)) = marker.split_once(op) {
+            if key.trim() == "sys_platform" {
+                let value = value.trim().trim_matches(|c| c == '"' || c == '\'');
+                return (value == current_sys_platform()) == equal;
+            }
+            return true;
+        }
+    }
+    true
+}
+
+/// Парсит файл requirements.txt и возвращает список пакетов.
+/// Пакеты, маркер окружения которых не подходит текущей платформе, пропускаются
 pub fn parse_requirements() -> Result<Vec<String>> {
     info!("Парсинг requirements.txt...");
     let requirements = fs::read_to_string("requirements.txt")?;
     Ok(requirements
         .lines()
         .filter(|line| !line.trim().is_empty())
-        .map(|line| {
-            line.split(['=', '>', '<', '~'])
-                .next()
-                .unwrap_or("")
-                .trim()
-                .to_string()
+        .filter_map(|line| {
+            let (spec, marker) = line.split_once(';').unwrap_or((line, ""));
+            if !marker.is_empty() && !marker_matches(marker) {
+                info!("Пропуск пакета для другой платформы: {}", line.trim());
+                return None;
+            }
+            Some(
+                spec.split(['=', '>', '<', '~'])
+                    .next()
+                    .unwrap_or("")
+                    .trim()
+                    .to_string()
+            )
         })
         .filter(|pkg| !pkg.is_empty())
         .collect())